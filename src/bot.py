@@ -4,7 +4,9 @@ Telegram bot for duty schedule notifications.
 """
 import os
 import sys
+import asyncio
 import logging
+import signal
 import fcntl
 import atexit
 import socket
@@ -12,17 +14,24 @@ import time
 from datetime import datetime, time
 import pytz
 from telegram import Update
-from telegram.ext import Application, CommandHandler
-from telegram.request import HTTPXRequest
+from telegram.ext import Application, CommandHandler, InlineQueryHandler
 
+from cassette import Cassette
 from config import Config
 from google_sheets import GoogleSheetsClient
 from handlers import DutyBotHandlers
+from health import HealthServer
+from monitoring import LoopWatchdog
+from update_processor import PerChatUpdateProcessor
+from logging_setup import setup_logging
+from tracing import TRACER, JsonlExporter, OtlpHttpExporter
+from transport import build_send_request, build_get_updates_request
 
 # Setup logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
+setup_logging(
+    level=Config.LOG_LEVEL,
+    json_format=Config.LOG_FORMAT == 'json',
+    sample_every=Config.LOG_SAMPLE_EVERY
 )
 logger = logging.getLogger(__name__)
 
@@ -103,6 +112,51 @@ def check_single_instance():
         return False
 
 
+def register_handlers(app: Application, handlers: DutyBotHandlers):
+    """Register all update handlers on the application."""
+    app.add_handler(CommandHandler("duty", handlers.cmd_duty))
+    app.add_handler(CommandHandler("time", handlers.cmd_time))
+    app.add_handler(CommandHandler("test", handlers.cmd_test))
+    app.add_handler(CommandHandler("chatid", handlers.cmd_chatid))
+    app.add_handler(CommandHandler("status", handlers.cmd_status))
+    app.add_handler(CommandHandler("test_on", handlers.cmd_test_on))
+    app.add_handler(CommandHandler("test_off", handlers.cmd_test_off))
+    app.add_handler(CommandHandler("reset_rate", handlers.cmd_reset_rate_limit))
+    app.add_handler(CommandHandler("calendar", handlers.cmd_check_calendar))
+    app.add_handler(CommandHandler("test_api", handlers.cmd_test_api))
+    app.add_handler(CommandHandler("subscribe", handlers.cmd_subscribe))
+    app.add_handler(CommandHandler("unsubscribe", handlers.cmd_unsubscribe))
+    app.add_handler(CommandHandler("stats", handlers.cmd_stats))
+    app.add_handler(CommandHandler("who", handlers.cmd_who))
+    app.add_handler(CommandHandler("reload", handlers.cmd_reload))
+    app.add_handler(InlineQueryHandler(handlers.inline_duty))
+
+
+async def reload_on_signal(application: Application, handlers: DutyBotHandlers):
+    """SIGHUP: re-read configuration like /reload does."""
+    try:
+        await handlers.reload_config(application.job_queue)
+    except Exception as e:
+        logger.error(f"❌ Configuration reload failed: {e}", exc_info=not isinstance(e, ValueError))
+
+
+def install_reload_signal(application: Application, handlers: DutyBotHandlers):
+    loop = asyncio.get_running_loop()
+    reloads = set()
+
+    def on_sighup():
+        logger.info("SIGHUP received, reloading configuration")
+        task = loop.create_task(reload_on_signal(application, handlers))
+        reloads.add(task)
+        task.add_done_callback(reloads.discard)
+
+    try:
+        loop.add_signal_handler(signal.SIGHUP, on_sighup)
+    except (AttributeError, NotImplementedError):
+        # Нет SIGHUP (Windows) - остаётся команда /reload
+        logger.warning("SIGHUP reload is not supported on this platform, use /reload")
+
+
 async def post_init(application: Application):
     """Log bot startup."""
     now = datetime.now(pytz.timezone('Europe/Moscow'))
@@ -115,6 +169,40 @@ async def post_init(application: Application):
     except Exception as e:
         logger.error(f"Failed to get bot info: {e}")
 
+    watchdog = application.bot_data.get('loop_watchdog')
+    if watchdog:
+        watchdog.start()
+
+    handlers = application.bot_data.get('handlers')
+    if handlers:
+        install_reload_signal(application, handlers)
+
+    outbox = application.bot_data.get('outbox')
+    if outbox:
+        await outbox.start(application.bot)
+
+    health_server = application.bot_data.get('health_server')
+    if health_server:
+        try:
+            await health_server.start()
+        except OSError as e:
+            logger.error(f"Failed to start health endpoint: {e}")
+
+
+async def post_shutdown(application: Application):
+    """Stop background services."""
+    outbox = application.bot_data.get('outbox')
+    if outbox:
+        await outbox.stop()
+
+    health_server = application.bot_data.get('health_server')
+    if health_server:
+        await health_server.stop()
+
+    watchdog = application.bot_data.get('loop_watchdog')
+    if watchdog:
+        watchdog.stop()
+
 
 def main():
     """Start the bot."""
@@ -135,86 +223,98 @@ def main():
         # Setup timezone
         moscow_tz = pytz.timezone('Europe/Moscow')
 
+        # Tracing of updates and jobs
+        exporters = []
+        if Config.TRACE_FILE:
+            exporters.append(JsonlExporter(Config.TRACE_FILE, Config.TRACE_MAX_BYTES, Config.TRACE_BACKUP_COUNT))
+        if Config.TRACE_OTLP_ENDPOINT:
+            exporters.append(OtlpHttpExporter(Config.TRACE_OTLP_ENDPOINT))
+        if exporters:
+            TRACER.configure(exporters)
+            logger.info(f"🔍 Tracing enabled: {Config.TRACE_FILE or '-'} {Config.TRACE_OTLP_ENDPOINT}")
+
+        # Record/replay of external API traffic
+        cassette = None
+        if Config.CASSETTE_MODE:
+            cassette = Cassette(Config.CASSETTE_FILE, Config.CASSETTE_MODE, Config.CASSETTE_LATENCY_SCALE)
+            if cassette.replaying:
+                cassette.load()
+            logger.warning(f"📼 Cassette {Config.CASSETTE_MODE} mode: {Config.CASSETTE_FILE}")
+
         # Initialize Google Sheets client
         google_client = GoogleSheetsClient(
             credentials_file=Config.GOOGLE_CREDENTIALS_FILE,
             spreadsheet_id=Config.SPREADSHEET_ID,
-            timezone=moscow_tz
+            timezone=moscow_tz,
+            cassette=cassette
         )
 
         # Initialize handlers
         handlers = DutyBotHandlers(Config, google_client, Config.TEST_MODE)
+        if cassette:
+            handlers.calendar_api.use_cassette(cassette)
 
-        # Create HTTP request with timeouts
-        request = HTTPXRequest(
-            connect_timeout=30.0,
-            read_timeout=30.0,
-            write_timeout=30.0,
-            pool_timeout=30.0
-        )
+        # Separate transports: pooled one for sends, long-poll one for getUpdates
+        request = build_send_request(Config)
+        get_updates_request = build_get_updates_request(Config)
 
         # Build application
         app = Application.builder() \
             .token(Config.TELEGRAM_TOKEN) \
             .request(request) \
+            .get_updates_request(get_updates_request) \
+            .concurrent_updates(PerChatUpdateProcessor(max(Config.CONCURRENT_UPDATES, 1))) \
             .post_init(post_init) \
+            .post_shutdown(post_shutdown) \
             .build()
 
         # Store test mode in bot_data
         app.bot_data['test_mode'] = Config.TEST_MODE
         app.bot_data['notification_sent_today'] = False
 
+        # Handlers are needed by the SIGHUP reload
+        app.bot_data['handlers'] = handlers
+
+        # Outbound priority queue (notifications > admin > user replies)
+        app.bot_data['outbox'] = handlers.outbox
+
+        # Event-loop lag watchdog
+        watchdog = LoopWatchdog(threshold=Config.LOOP_LAG_THRESHOLD)
+        app.bot_data['loop_watchdog'] = watchdog
+
+        # In-process health endpoint (replaces the external HEALTHCHECK probe)
+        if Config.HEALTH_PORT:
+            app.bot_data['health_server'] = HealthServer(
+                app, handlers, watchdog,
+                host=Config.HEALTH_HOST,
+                port=Config.HEALTH_PORT,
+                stall_seconds=Config.HEALTH_LOOP_STALL_SECONDS
+            )
+
         # Check job queue
         if app.job_queue is None:
             logger.error("❌ JobQueue not available")
             return
 
         # Add command handlers
-        app.add_handler(CommandHandler("duty", handlers.cmd_duty))
-        app.add_handler(CommandHandler("time", handlers.cmd_time))
-        app.add_handler(CommandHandler("test", handlers.cmd_test))
-        app.add_handler(CommandHandler("chatid", handlers.cmd_chatid))
-        app.add_handler(CommandHandler("status", handlers.cmd_status))
-        app.add_handler(CommandHandler("test_on", handlers.cmd_test_on))
-        app.add_handler(CommandHandler("test_off", handlers.cmd_test_off))
-        app.add_handler(CommandHandler("reset_rate", handlers.cmd_reset_rate_limit))
-        app.add_handler(CommandHandler("calendar", handlers.cmd_check_calendar))
-        app.add_handler(CommandHandler("test_api", handlers.cmd_test_api))
+        register_handlers(app, handlers)
+
+        # Background upkeep (token refresh, spreadsheet metadata)
+        handlers.schedule_service_jobs(app.job_queue)
 
         # Setup jobs based on mode
         if Config.TEST_MODE:
             # Test mode: every minute
-            app.job_queue.run_once(
-                handlers.send_notification,
-                when=10,
-                name="test_once"
-            )
-            app.job_queue.run_repeating(
-                handlers.send_notification,
-                interval=60,
-                first=70,
-                name="test_repeating"
-            )
+            handlers.schedule_test_jobs(app.job_queue)
             logger.info("🔴 Test mode: notifications every minute")
         else:
-            notification_time = time(
-                hour=Config.NOTIFY_HOUR,
-                minute=Config.NOTIFY_MINUTE,
-                second=0,
-            )
-
-            app.job_queue.run_daily(
-                handlers.send_notification,
-                time=notification_time,
-                days=tuple(range(7)),
-                name="daily"
-            )
-
-            logger.info(f"🟢 Production mode: daily at {Config.NOTIFY_HOUR:02d}:{Config.NOTIFY_MINUTE:02d} MSK")
+            handlers.schedule_production_jobs(app.job_queue)
+            logger.info(f"🟢 Production mode: working days at {Config.NOTIFY_HOUR:02d}:{Config.NOTIFY_MINUTE:02d} MSK "
+                        f"(prepared {Config.NOTIFY_PREPARE_MINUTES} min ahead)")
 
         # Start bot
         logger.info("🔄 Starting bot polling...")
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        app.run_polling(allowed_updates=Update.ALL_TYPES, timeout=Config.TELEGRAM_POLL_TIMEOUT)
 
     except Exception as e:
         logger.error(f"❌ Failed to start bot: {e}", exc_info=True)
@@ -0,0 +1,194 @@
+"""
+Record/replay of external API traffic (Google Sheets, production calendar).
+
+In record mode every request/response pair is appended to a JSONL cassette
+together with its duration; in replay mode responses are served from the
+cassette with the recorded (optionally scaled) latency, so a slow day in
+production can be reproduced and measured offline.
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+import time as time_module
+from collections import deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+logger = logging.getLogger(__name__)
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+REDACTED = "<redacted>"
+
+# Credential-like JSON fields that are blanked in recorded bodies
+_TOKEN_FIELD_RE = re.compile(
+    r'("(?:access_token|refresh_token|id_token|token|api_key|private_key|private_key_id|client_secret)"'
+    r'\s*:\s*)"(?:[^"\\]|\\.)*"'
+)
+
+# Digit runs (dates, sheet numbers) masked in the fallback endpoint
+_DIGITS_RE = re.compile(r"\d+")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when the cassette has no matching interaction."""
+
+
+class Cassette:
+    """JSONL file of recorded interactions.
+
+    Secrets registered with :meth:`redact` (API tokens, spreadsheet IDs) are
+    replaced in URLs, parameters and response bodies before anything is
+    written or matched; credential-like JSON fields in bodies are blanked.
+    Roster content is NOT removed: a cassette holds employee names and
+    duty assignments, so treat it like the spreadsheet itself.
+    """
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.hits = 0
+        self.misses = 0
+        self._secrets: List[str] = []
+        self._lock = threading.Lock()
+        self._exact: Dict[str, Deque[dict]] = {}
+        self._by_endpoint: Dict[Tuple[str, str, str], Deque[dict]] = {}
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    def redact(self, *secrets: Optional[str]):
+        """Register values that must never reach the cassette."""
+        self._secrets.extend(secret for secret in secrets if secret)
+
+    def _scrub(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def _scrub_body(self, body: str) -> str:
+        return _TOKEN_FIELD_RE.sub(lambda m: f'{m.group(1)}"{REDACTED}"', self._scrub(body))
+
+    def _key(self, service: str, method: str, url: str, params: Optional[Mapping[str, Any]]) -> str:
+        return self._scrub(json.dumps([service, method.upper(), url, params or {}],
+                                      sort_keys=True, ensure_ascii=False, default=str))
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        """Host and path of a scrubbed URL with digits masked, e.g. a calendar day or a Drive file."""
+        parts = urlsplit(url)
+        return parts.netloc + _DIGITS_RE.sub("#", parts.path)
+
+    def load(self):
+        """Read a cassette for replay."""
+        count = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._exact.setdefault(entry["key"], deque()).append(entry)
+                self._by_endpoint.setdefault(
+                    (entry["service"], entry["method"], self._endpoint(entry["url"])), deque()
+                ).append(entry)
+                count += 1
+        logger.info(f"📼 Cassette {self.path}: {count} interactions loaded for replay "
+                    f"(latency x{self.latency_scale})")
+
+    def record(self, service: str, method: str, url: str, params: Optional[Mapping[str, Any]],
+               status: int, body: str, elapsed: float):
+        entry = {
+            "key": self._key(service, method, url, params),
+            "service": service,
+            "method": method.upper(),
+            "url": self._scrub(url),
+            "status": status,
+            "body": self._scrub_body(body),
+            "elapsed": round(elapsed, 4),
+            "at": time_module.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def lookup(self, service: str, method: str, url: str,
+               params: Optional[Mapping[str, Any]] = None) -> dict:
+        """Next recorded interaction for a request.
+
+        Matching is exact (service, method, URL, parameters) and falls back to
+        the next interaction of the same endpoint (host and path, digits
+        masked), so a cassette recorded on another day still replays with
+        realistic latencies while a Drive revision never answers a Sheets read.
+        Interactions are served in recorded order, cycling when exhausted.
+        """
+        with self._lock:
+            queue = self._exact.get(self._key(service, method, url, params))
+            if queue:
+                self.hits += 1
+            else:
+                queue = self._by_endpoint.get((service, method.upper(), self._endpoint(self._scrub(url))))
+                if not queue:
+                    raise CassetteMiss(f"No recorded {service} {method} {self._scrub(url)}")
+                self.misses += 1
+                logger.debug("Cassette: inexact match for %s %s", method, self._scrub(url))
+
+            entry = queue[0]
+            if len(queue) > 1:
+                queue.rotate(-1)
+            return entry
+
+    def latency(self, entry: dict) -> float:
+        return entry["elapsed"] * self.latency_scale
+
+    def replay_sync(self, service: str, method: str, url: str,
+                    params: Optional[Mapping[str, Any]] = None) -> dict:
+        entry = self.lookup(service, method, url, params)
+        time_module.sleep(self.latency(entry))
+        return entry
+
+    async def replay_async(self, service: str, method: str, url: str,
+                           params: Optional[Mapping[str, Any]] = None) -> dict:
+        entry = self.lookup(service, method, url, params)
+        await asyncio.sleep(self.latency(entry))
+        return entry
+
+
+def cassette_http_client(cassette: Cassette) -> type:
+    """gspread HTTP client class that records to or replays from the cassette."""
+
+    class CassetteHTTPClient(HTTPClient):
+        def request(self, method: str, endpoint: str, params=None, data=None, json=None,
+                    files=None, headers=None) -> requests.Response:
+            if cassette.replaying:
+                entry = cassette.replay_sync("sheets", method, endpoint, params)
+                response = requests.Response()
+                response.status_code = entry["status"]
+                response._content = entry["body"].encode("utf-8")
+                response.headers["Content-Type"] = "application/json; charset=UTF-8"
+                response.url = endpoint
+            else:
+                started = time_module.monotonic()
+                response = self.session.request(
+                    method=method, url=endpoint, json=json, params=params, data=data,
+                    files=files, headers=headers, timeout=self.timeout,
+                )
+                cassette.record("sheets", method, endpoint, params, response.status_code,
+                                response.text, time_module.monotonic() - started)
+
+            if response.ok:
+                return response
+            raise APIError(response)
+
+    return CassetteHTTPClient
@@ -1,38 +1,179 @@
 """
 Configuration module for loading environment variables.
 """
+import importlib.util
 import os
 import logging
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Dict, List, Mapping, Set, Tuple
+from dotenv import load_dotenv, dotenv_values
 
-# Load environment variables from .env file
 env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(dotenv_path=env_path)
+
+# Mapping the settings are read from. A reload evaluates this module again
+# against a candidate copy, so nothing global changes before validation.
+_environ: Mapping[str, str] = globals().get('_environ', os.environ)
+
+if _environ is os.environ:
+    # Environment as given to the process, before .env is applied
+    _PROCESS_ENV = dict(os.environ)
+
+    # Load environment variables from .env file
+    load_dotenv(dotenv_path=env_path)
+    _env_file_keys = set(dotenv_values(env_path))
 
 logger = logging.getLogger(__name__)
 
+# Settings bound at startup (token, transports, workers, logging, sinks): a reload
+# reports their changes but keeps the running values until a restart.
+# TEST_MODE is only the initial mode - it is switched at runtime by /test_on and /test_off.
+STARTUP_ONLY = frozenset({
+    'TELEGRAM_TOKEN', 'TEST_MODE', 'CONCURRENT_UPDATES',
+    'TELEGRAM_POOL_SIZE', 'TELEGRAM_CONNECT_TIMEOUT', 'TELEGRAM_READ_TIMEOUT',
+    'TELEGRAM_WRITE_TIMEOUT', 'TELEGRAM_POOL_TIMEOUT', 'TELEGRAM_KEEPALIVE_EXPIRY',
+    'TELEGRAM_HTTP2', 'TELEGRAM_POLL_TIMEOUT',
+    'HEALTH_HOST', 'HEALTH_PORT', 'HEALTH_LOOP_STALL_SECONDS', 'LOOP_LAG_THRESHOLD',
+    'OUTBOX_WORKERS', 'OUTBOX_MAXSIZE',
+    'LOG_LEVEL', 'LOG_FORMAT', 'LOG_SAMPLE_EVERY',
+    'TRACE_FILE', 'TRACE_MAX_BYTES', 'TRACE_BACKUP_COUNT', 'TRACE_OTLP_ENDPOINT',
+    'CASSETTE_MODE', 'CASSETTE_FILE', 'CASSETTE_LATENCY_SCALE',
+})
+
+
+def _getenv(key: str, default=None):
+    return _environ.get(key, default)
+
+
+def _candidate_env() -> Tuple[Dict[str, str], Set[str]]:
+    """Process environment with .env re-applied over it (on reload the file wins)."""
+    values = {key: value for key, value in dotenv_values(env_path).items() if value is not None}
+    environ = dict(os.environ)
+    # Ключи, удалённые из .env, возвращаются к значению из окружения процесса
+    for key in _env_file_keys - set(values):
+        if key in _PROCESS_ENV:
+            environ[key] = _PROCESS_ENV[key]
+        else:
+            environ.pop(key, None)
+    environ.update(values)
+    return environ, set(values)
+
+
+def _commit_env(environ: Dict[str, str], file_keys: Set[str]):
+    global _env_file_keys
+    for key in set(os.environ) - set(environ):
+        del os.environ[key]
+    os.environ.update(environ)
+    _env_file_keys = file_keys
+
+
+def _read_config_class(environ: Mapping[str, str]) -> type:
+    """Evaluate this module again to get a Config built from the given environment."""
+    spec = importlib.util.spec_from_file_location('_config_reload', __file__)
+    module = importlib.util.module_from_spec(spec)
+    module._environ = environ
+    spec.loader.exec_module(module)
+    return module.Config
+
 
 class Config:
     """Application configuration from environment variables."""
 
     # Telegram
-    TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-    GROUP_CHAT_ID = os.getenv('GROUP_CHAT_ID')
-    ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', '0'))
+    TELEGRAM_TOKEN = _getenv('TELEGRAM_TOKEN')
+    GROUP_CHAT_ID = _getenv('GROUP_CHAT_ID')
+    ADMIN_USER_ID = int(_getenv('ADMIN_USER_ID', '0'))
 
     # Google Sheets
-    SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')
-    GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', '/app/service_account.json')
+    SPREADSHEET_ID = _getenv('SPREADSHEET_ID')
+    GOOGLE_CREDENTIALS_FILE = _getenv('GOOGLE_CREDENTIALS_FILE', '/app/service_account.json')
+
+    # How often to refresh the token and revalidate cached spreadsheet metadata (seconds)
+    SHEETS_MAINTENANCE_INTERVAL = int(_getenv('SHEETS_MAINTENANCE_INTERVAL', '60'))
 
     # Notification time (MSK)
-    NOTIFY_HOUR = int(os.getenv('NOTIFY_HOUR', '10'))
-    NOTIFY_MINUTE = int(os.getenv('NOTIFY_MINUTE', '0'))
+    NOTIFY_HOUR = int(_getenv('NOTIFY_HOUR', '10'))
+    NOTIFY_MINUTE = int(_getenv('NOTIFY_MINUTE', '0'))
+
+    # Notification time on shortened pre-holiday days (MSK, empty - same as NOTIFY_HOUR/MINUTE)
+    NOTIFY_SHORT_DAY_HOUR = _getenv('NOTIFY_SHORT_DAY_HOUR', '')
+    NOTIFY_SHORT_DAY_MINUTE = int(_getenv('NOTIFY_SHORT_DAY_MINUTE', '0'))
+
+    # How many working days ahead the notification schedule is planned
+    WORKDAY_PLAN_DAYS = int(_getenv('WORKDAY_PLAN_DAYS', '10'))
+
+    # How many minutes before the notification its payload is prepared (0 - prepare inline)
+    NOTIFY_PREPARE_MINUTES = int(_getenv('NOTIFY_PREPARE_MINUTES', '10'))
+
+    # How many updates are handled concurrently (updates of one chat always run in order)
+    CONCURRENT_UPDATES = int(_getenv('CONCURRENT_UPDATES', '16'))
 
     # Test mode
-    TEST_MODE = os.getenv('TEST_MODE', 'false').lower() == 'true'
+    TEST_MODE = _getenv('TEST_MODE', 'false').lower() == 'true'
+
+    SPREADSHEET_URL = _getenv('SPREADSHEET_URL', '')
+
+    # Personal subscriptions: storage file and reminder hours (MSK)
+    SUBSCRIPTIONS_FILE = _getenv('SUBSCRIPTIONS_FILE', str(Path(__file__).parent.parent / 'data' / 'subscriptions.json'))
+    SUBSCRIPTION_EVENING_HOUR = int(_getenv('SUBSCRIPTION_EVENING_HOUR', '18'))
+    SUBSCRIPTION_MORNING_HOUR = int(_getenv('SUBSCRIPTION_MORNING_HOUR', '8'))
 
-    SPREADSHEET_URL = os.getenv('SPREADSHEET_URL', '')
+    # /duty requests in one chat within this window get a reaction instead of another reply (seconds, 0 - off)
+    DUTY_COALESCE_WINDOW = int(_getenv('DUTY_COALESCE_WINDOW', '60'))
+
+    # Stale-while-revalidate for /duty (seconds): a snapshot older than the soft TTL
+    # is served and refreshed in the background, older than the hard TTL is refreshed first
+    SNAPSHOT_SOFT_TTL = int(_getenv('SNAPSHOT_SOFT_TTL', '300'))
+    SNAPSHOT_HARD_TTL = int(_getenv('SNAPSHOT_HARD_TTL', '3600'))
+    # Show the snapshot age in /duty replies when it is older than this (seconds)
+    SNAPSHOT_SHOW_AGE_AFTER = int(_getenv('SNAPSHOT_SHOW_AGE_AFTER', '900'))
+
+    # Month snapshots kept in memory besides the current and next month (read for /stats)
+    STATS_CACHED_ROSTERS = int(_getenv('STATS_CACHED_ROSTERS', '3'))
+
+    # Telegram-side cache time for inline query answers (seconds)
+    INLINE_CACHE_TIME = int(_getenv('INLINE_CACHE_TIME', '60'))
+
+    # Health endpoint (0 - disabled)
+    HEALTH_HOST = _getenv('HEALTH_HOST', '0.0.0.0')
+    HEALTH_PORT = int(_getenv('HEALTH_PORT', '8080'))
+    HEALTH_LOOP_STALL_SECONDS = float(_getenv('HEALTH_LOOP_STALL_SECONDS', '5'))
+
+    # ICS/CSV duty feeds on the health endpoint: required ?token= value ('' - feeds are disabled)
+    FEED_TOKEN = _getenv('FEED_TOKEN', '')
+
+    # Outbound message queue: sender workers (0 - send inline) and capacity
+    OUTBOX_WORKERS = int(_getenv('OUTBOX_WORKERS', '4'))
+    OUTBOX_MAXSIZE = int(_getenv('OUTBOX_MAXSIZE', '500'))
+
+    # Telegram HTTP: pooled transport for sends (timeouts in seconds, HTTP/2 needs the 'h2' package)
+    TELEGRAM_POOL_SIZE = int(_getenv('TELEGRAM_POOL_SIZE', '32'))
+    TELEGRAM_CONNECT_TIMEOUT = float(_getenv('TELEGRAM_CONNECT_TIMEOUT', '5'))
+    TELEGRAM_READ_TIMEOUT = float(_getenv('TELEGRAM_READ_TIMEOUT', '10'))
+    TELEGRAM_WRITE_TIMEOUT = float(_getenv('TELEGRAM_WRITE_TIMEOUT', '10'))
+    TELEGRAM_POOL_TIMEOUT = float(_getenv('TELEGRAM_POOL_TIMEOUT', '3'))
+    TELEGRAM_KEEPALIVE_EXPIRY = float(_getenv('TELEGRAM_KEEPALIVE_EXPIRY', '60'))
+    TELEGRAM_HTTP2 = _getenv('TELEGRAM_HTTP2', 'false').lower() == 'true'
+    # Long-poll timeout of getUpdates (added to the read timeout of the polling transport)
+    TELEGRAM_POLL_TIMEOUT = int(_getenv('TELEGRAM_POLL_TIMEOUT', '30'))
+
+    # Event-loop lag above this is logged with a stack sample (seconds)
+    LOOP_LAG_THRESHOLD = float(_getenv('LOOP_LAG_THRESHOLD', '0.5'))
+
+    # Logging: level, format (text/json) and 1-in-N sampling of high-frequency messages
+    LOG_LEVEL = _getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = _getenv('LOG_FORMAT', 'text').lower()
+    LOG_SAMPLE_EVERY = int(_getenv('LOG_SAMPLE_EVERY', '10'))
+
+    # Tracing: rotating JSONL sink ('' - disabled) and optional OTLP/HTTP collector endpoint
+    TRACE_FILE = _getenv('TRACE_FILE', '')
+    TRACE_MAX_BYTES = int(_getenv('TRACE_MAX_BYTES', str(10 * 1024 * 1024)))
+    TRACE_BACKUP_COUNT = int(_getenv('TRACE_BACKUP_COUNT', '3'))
+    TRACE_OTLP_ENDPOINT = _getenv('TRACE_OTLP_ENDPOINT', '')
+
+    # Record/replay of Google Sheets and calendar traffic ('' - off, record, replay)
+    CASSETTE_MODE = _getenv('CASSETTE_MODE', '').lower()
+    CASSETTE_FILE = _getenv('CASSETTE_FILE', str(Path(__file__).parent.parent / 'data' / 'cassette.jsonl'))
+    CASSETTE_LATENCY_SCALE = float(_getenv('CASSETTE_LATENCY_SCALE', '1.0'))
 
     @classmethod
     def validate(cls):
@@ -59,4 +200,37 @@ class Config:
         if not os.path.exists(cls.GOOGLE_CREDENTIALS_FILE):
             logger.warning(f"Google credentials file not found: {cls.GOOGLE_CREDENTIALS_FILE}")
 
-        return True
\ No newline at end of file
+        return True
+
+    @classmethod
+    def settings(cls) -> List[str]:
+        """Names of all settings."""
+        return [name for name in vars(cls) if name.isupper()]
+
+    @classmethod
+    def reload(cls) -> Tuple[Dict[str, tuple], List[str]]:
+        """Re-read .env and apply changed settings in place.
+
+        Returns the applied changes as {name: (old, new)} and the names of
+        changed settings that need a restart (see STARTUP_ONLY). An invalid
+        new configuration raises ValueError and nothing is applied.
+        """
+        environ, file_keys = _candidate_env()
+        fresh = _read_config_class(environ)
+        fresh.validate()
+        # Окружение процесса меняется только после успешной проверки
+        _commit_env(environ, file_keys)
+
+        applied, pending = {}, []
+        for name in cls.settings():
+            old, new = getattr(cls, name), getattr(fresh, name, None)
+            if old == new:
+                continue
+            if name in STARTUP_ONLY:
+                pending.append(name)
+            else:
+                applied[name] = (old, new)
+
+        for name, (_, new) in applied.items():
+            setattr(cls, name, new)
+        return applied, pending
@@ -0,0 +1,158 @@
+"""
+ICS and CSV duty feeds generated from cached roster snapshots.
+
+Feeds never read Google Sheets: they cover the months that are already in
+memory. Validators (ETag, Last-Modified) come from the snapshot revisions,
+so a calendar client polling an unchanged roster gets a 304.
+"""
+import csv
+import hashlib
+import io
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from roster import MonthRoster, ROLE_LEADER, ROLE_FOLLOWER
+
+# Bump when the feed layout changes so clients re-download
+FEED_FORMAT_VERSION = 1
+
+# Lines written to the response at once
+CHUNK_LINES = 200
+
+FORMAT_ICS = "ics"
+FORMAT_CSV = "csv"
+CONTENT_TYPES = {
+    FORMAT_ICS: "text/calendar",
+    FORMAT_CSV: "text/csv",
+}
+
+ROLE_TITLES = {ROLE_LEADER: "ведущий", ROLE_FOLLOWER: "ведомый"}
+
+
+def ordered(rosters: Iterable[MonthRoster]) -> List[MonthRoster]:
+    return sorted(rosters, key=lambda roster: roster.dates[:1])
+
+
+def feed_etag(rosters: List[MonthRoster], fmt: str, subject: str) -> str:
+    """Strong ETag of a feed: changes with any snapshot revision of the months it covers."""
+    parts = sorted(
+        (roster.sheet_name, roster.revision if roster.revision is not None else roster.fetched_at)
+        for roster in rosters
+    )
+    digest = hashlib.sha1(repr((FEED_FORMAT_VERSION, fmt, subject, parts)).encode("utf-8")).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def feed_last_modified(rosters: List[MonthRoster], revision: Optional[int],
+                       modified_time: Optional[str]) -> datetime:
+    """Modification time of the spreadsheet if all snapshots are of its current revision.
+
+    Otherwise the time of the latest snapshot, in whole seconds as HTTP dates are.
+    """
+    if modified_time and rosters and all(roster.revision == revision for roster in rosters):
+        modified = datetime.fromisoformat(modified_time.replace("Z", "+00:00"))
+    else:
+        modified = datetime.fromtimestamp(max(roster.fetched_at for roster in rosters), tz=timezone.utc)
+    return modified.replace(microsecond=0)
+
+
+def team_days(rosters: List[MonthRoster]) -> Iterator[Tuple[date, List[Tuple[str, int]]]]:
+    """(day, [(name, role)]) for days with a leader or follower."""
+    for roster in rosters:
+        for day in roster.dates:
+            duty = [(name, role) for name, role in roster.day(day) if role in ROLE_TITLES]
+            if duty:
+                yield day, duty
+
+
+def employee_days(rosters: List[MonthRoster], name: str) -> Iterator[Tuple[date, List[Tuple[str, int]]]]:
+    for roster in rosters:
+        for day, role in roster.employee(name):
+            if role in ROLE_TITLES:
+                yield day, [(name, role)]
+
+
+def _ics_escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _ics_fold(line: str) -> str:
+    """Fold a content line to 75 octets (RFC 5545, 3.1) without splitting characters."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        # Первая строка - 75 октетов, продолжения - 74 плюс ведущий пробел
+        if size + width > (75 if not parts else 74):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def ics_lines(days: Iterable[Tuple[date, List[Tuple[str, int]]]], calendar_name: str,
+              uid_scope: str, stamp: datetime, team: bool) -> Iterator[str]:
+    """VCALENDAR with one all-day event per duty day."""
+    dtstamp = stamp.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    uid_suffix = hashlib.sha1(uid_scope.encode("utf-8")).hexdigest()[:12]
+
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield "PRODID:-//duty-bot//roster feed//RU\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    yield "METHOD:PUBLISH\r\n"
+    yield _ics_fold(f"X-WR-CALNAME:{_ics_escape(calendar_name)}")
+    yield "X-WR-TIMEZONE:Europe/Moscow\r\n"
+
+    for day, duty in days:
+        if team:
+            summary = "Дежурные: " + ", ".join(
+                f"{name} ({ROLE_TITLES[role]})" if role == ROLE_LEADER else name for name, role in duty
+            )
+        else:
+            summary = f"Дежурство ({ROLE_TITLES[duty[0][1]]})"
+        yield "BEGIN:VEVENT\r\n"
+        # UID постоянен для дня, чтобы клиенты обновляли событие, а не дублировали
+        yield f"UID:{day.strftime('%Y%m%d')}-{uid_suffix}@duty-bot\r\n"
+        yield f"DTSTAMP:{dtstamp}\r\n"
+        yield f"DTSTART;VALUE=DATE:{day.strftime('%Y%m%d')}\r\n"
+        yield f"DTEND;VALUE=DATE:{(day + timedelta(days=1)).strftime('%Y%m%d')}\r\n"
+        yield _ics_fold(f"SUMMARY:{_ics_escape(summary)}")
+        yield "TRANSP:TRANSPARENT\r\n"
+        yield "END:VEVENT\r\n"
+
+    yield "END:VCALENDAR\r\n"
+
+
+def csv_lines(days: Iterable[Tuple[date, List[Tuple[str, int]]]]) -> Iterator[str]:
+    """date,name,role rows, one per employee on duty."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(["date", "name", "role"])
+    for day, duty in days:
+        for name, role in duty:
+            writer.writerow([day.isoformat(), name, ROLE_TITLES[role]])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок пустой ленты
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def chunks(lines: Iterable[str], size: int = CHUNK_LINES) -> Iterator[bytes]:
+    """Join generated lines into response-sized byte chunks."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield "".join(batch).encode("utf-8")
+            batch = []
+    if batch:
+        yield "".join(batch).encode("utf-8")
@@ -2,24 +2,285 @@
 Google Sheets integration module.
 """
 import os
+import re
 import logging
-from datetime import datetime
+import threading
+import time as time_module
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 import pytz
 import gspread
+from gspread.http_client import HTTPClient
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
-from gspread_formatting import get_effective_format
+
+from cassette import Cassette, cassette_http_client
+from circuit import CircuitBreaker
+from roster import MonthRoster, ROLE_NONE, ROLE_LEADER, ROLE_FOLLOWER, ROLE_VACATION
+from tracing import TRACER
 
 logger = logging.getLogger(__name__)
 
 
+# Google Sheets serial dates count days from 30.12.1899
+SERIAL_DATE_EPOCH = date(1899, 12, 30)
+SERIAL_DATE_RANGE = (30000, 80000)
+
+# 01.03, 1.3, 01.03.2026, 01/03/26, 2026-03-01
+_NUMERIC_DATE_RE = re.compile(r'(\d{1,4})[./-](\d{1,2})(?:[./-](\d{2,4}))?')
+# 1 марта, 01 мар.
+_TEXT_DATE_RE = re.compile(r'(\d{1,2})\s*([а-яё]{3,})', re.IGNORECASE)
+
+_RU_MONTH_PREFIXES = (
+    ('янв', 1), ('фев', 2), ('мар', 3), ('апр', 4), ('май', 5), ('мая', 5),
+    ('июн', 6), ('июл', 7), ('авг', 8), ('сен', 9), ('окт', 10), ('ноя', 11), ('дек', 12),
+)
+
+
+def _infer_year(month: int, sheet_year: int, sheet_month: int) -> int:
+    """Year for a header without one, allowing spill-over into adjacent months."""
+    if month - sheet_month > 6:
+        return sheet_year - 1
+    if sheet_month - month > 6:
+        return sheet_year + 1
+    return sheet_year
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_header_date(value, sheet_year: int, sheet_month: int) -> Optional[date]:
+    """Parse a header cell into a date.
+
+    Supports ``dd.mm`` / ``d.m`` (with optional year), ISO dates, Russian
+    month names, serial date values and a bare day of the sheet's month.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        if SERIAL_DATE_RANGE[0] <= value <= SERIAL_DATE_RANGE[1]:
+            return SERIAL_DATE_EPOCH + timedelta(days=int(value))
+        if value == int(value) and 1 <= value <= 31:
+            return _safe_date(sheet_year, sheet_month, int(value))
+        return None
+
+    text = str(value).strip()
+    if not text:
+        return None
+
+    if text.isdigit():
+        return parse_header_date(int(text), sheet_year, sheet_month)
+
+    match = _NUMERIC_DATE_RE.search(text)
+    if match:
+        first, second, third = match.groups()
+        if len(first) == 4:
+            # ISO: 2026-03-01
+            if third is None:
+                return None
+            return _safe_date(int(first), int(second), int(third))
+
+        day, month = int(first), int(second)
+        if third:
+            year = int(third)
+            if year < 100:
+                year += 2000
+        else:
+            year = _infer_year(month, sheet_year, sheet_month)
+        return _safe_date(year, month, day)
+
+    match = _TEXT_DATE_RE.search(text)
+    if match:
+        month_name = match.group(2).lower()
+        for prefix, month in _RU_MONTH_PREFIXES:
+            if month_name.startswith(prefix):
+                year = _infer_year(month, sheet_year, sheet_month)
+                return _safe_date(year, month, int(match.group(1)))
+
+    return None
+
+
+class DateColumnIndex:
+    """Date -> column index built once from a sheet header row."""
+
+    def __init__(self, headers: list, sheet_year: int, sheet_month: int):
+        self.columns: Dict[date, int] = {}
+
+        for i, header in enumerate(headers):
+            parsed = parse_header_date(header, sheet_year, sheet_month)
+            # Первый столбец с датой выигрывает (объединённые/повторные заголовки)
+            if parsed and parsed not in self.columns:
+                self.columns[parsed] = i
+
+        self._dates = sorted(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def column_for(self, day) -> int:
+        """Column index for a date, -1 if the date has no column."""
+        if isinstance(day, datetime):
+            day = day.date()
+        return self.columns.get(day, -1)
+
+    def dates(self) -> List[date]:
+        """All dates present in the header, in chronological order."""
+        return list(self._dates)
+
+
+# Only values and background colors are requested from the grid
+GRID_FIELDS = ("sheets(properties(title),data(rowData(values("
+               "formattedValue,effectiveFormat(backgroundColor)))))")
+
+
+# Refresh the access token this long before it expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# A missing sheet triggers a revision check at most this often (seconds)
+MISSING_SHEET_RECHECK = 30
+
+
+def a1_sheet(sheet_name: str) -> str:
+    """Quote a sheet name for use in A1 notation."""
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def traced_http_client(base: type) -> type:
+    """gspread HTTP client class that wraps every API request in a trace span."""
+
+    class TracedHTTPClient(base):
+        def request(self, method: str, endpoint: str, *args, **kwargs):
+            with TRACER.span("sheets.http", method=method.upper(), path=urlsplit(endpoint).path) as span:
+                response = super().request(method, endpoint, *args, **kwargs)
+                span.set("status", response.status_code).set("bytes", len(response.content))
+                return response
+
+    return TracedHTTPClient
+
+
+def column_letter(index: int) -> str:
+    """A1 column letter for a zero-based column index (0 -> A, 26 -> AA)."""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _month_end(day: date) -> date:
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+class DutyResult:
+    """Duty assignments for a single day as read from the spreadsheet."""
+
+    def __init__(self, date: date):
+        self.date = date
+        self.leaders: List[str] = []
+        self.followers: List[str] = []
+        self.vacation: List[str] = []
+        self.error: Optional[str] = None
+
+    @property
+    def has_duty(self) -> bool:
+        return bool(self.leaders or self.followers)
+
+    def add(self, name: str, role: int):
+        if role == ROLE_LEADER:
+            self.leaders.append(name)
+        elif role == ROLE_FOLLOWER:
+            self.followers.append(name)
+        elif role == ROLE_VACATION:
+            self.vacation.append(name)
+
+
+class SpreadsheetMetadata:
+    """Cached sheet list of a spreadsheet, invalidated by the Drive file revision."""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.sheets: Dict[str, int] = {}
+        self.revision: Optional[int] = None
+        self.modified_time: Optional[str] = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+
+    @property
+    def titles(self) -> List[str]:
+        return list(self.sheets)
+
+    def load(self):
+        """Fetch sheet titles and IDs together with the current revision."""
+        self.fetch_revision()
+        with TRACER.span("sheets.metadata"):
+            metadata = self.spreadsheet.fetch_sheet_metadata(
+                params={"fields": "sheets(properties(title,sheetId))"}
+            )
+        self.sheets = {
+            sheet["properties"]["title"]: sheet["properties"]["sheetId"]
+            for sheet in metadata.get("sheets", [])
+        }
+        self.loaded_at = time_module.time()
+        logger.info(f"Spreadsheet metadata loaded: {len(self.sheets)} sheets, revision {self.revision}")
+
+    def fetch_revision(self) -> Optional[int]:
+        """Read the file revision from the Drive API."""
+        with TRACER.span("drive.revision"):
+            response = self.spreadsheet.client.request(
+                "get",
+                f"{DRIVE_FILES_API_V3_URL}/{self.spreadsheet.id}",
+                params={"fields": "version,modifiedTime", "supportsAllDrives": True},
+            )
+        data = response.json()
+        self.revision = int(data["version"]) if "version" in data else None
+        self.modified_time = data.get("modifiedTime")
+        self.checked_at = time_module.time()
+        return self.revision
+
+    def refresh_if_changed(self) -> bool:
+        """Reload the sheet list if the spreadsheet revision changed."""
+        known = self.revision
+        if self.fetch_revision() != known or not self.sheets:
+            self.load()
+            return True
+        return False
+
+
 class GoogleSheetsClient:
     """Client for interacting with Google Sheets."""
 
-    def __init__(self, credentials_file: str, spreadsheet_id: str, timezone):
+    def __init__(self, credentials_file: str, spreadsheet_id: str, timezone,
+                 cassette: Optional[Cassette] = None):
         self.credentials_file = credentials_file
         self.spreadsheet_id = spreadsheet_id
         self.timezone = timezone
+        self.cassette = cassette
+        if cassette:
+            cassette.redact(spreadsheet_id)
         self.client = None
+        self.credentials = None
+        self.spreadsheet = None
+        self.metadata: Optional[SpreadsheetMetadata] = None
+        self._lock = threading.Lock()
+        self._header_indexes: Dict[str, Tuple[tuple, DateColumnIndex]] = {}
+        # sheet -> (revision, header row) for ranged reads
+        self._header_rows: Dict[str, Tuple[Optional[int], list]] = {}
+        self.rosters: Dict[str, MonthRoster] = {}
+        self.circuit = CircuitBreaker("google_sheets")
 
         # Russian month names
         self.months_ru = {
@@ -30,6 +291,16 @@ class GoogleSheetsClient:
 
     def connect(self):
         """Establish connection to Google Sheets."""
+        http_client = traced_http_client(cassette_http_client(self.cassette) if self.cassette else HTTPClient)
+
+        if self.cassette and self.cassette.replaying:
+            # Ответы берутся из кассеты, ключи не нужны
+            self.client = gspread.Client(AnonymousCredentials(), http_client=http_client)
+            self.spreadsheet = None
+            self.metadata = None
+            logger.info("✅ Google Sheets replayed from cassette")
+            return True
+
         logger.info(f"Attempting to connect with credentials: {self.credentials_file}")
         logger.info(f"File exists: {os.path.exists(self.credentials_file)}")
 
@@ -48,66 +319,140 @@ class GoogleSheetsClient:
             ]
 
             creds = Credentials.from_service_account_file(self.credentials_file, scopes=scopes)
-            self.client = gspread.authorize(creds)
+            self.client = gspread.authorize(creds, http_client=http_client)
+            self.credentials = creds
+            self.spreadsheet = None
+            self.metadata = None
+            self.refresh_token_if_needed()
             logger.info("✅ Connected to Google Sheets successfully")
             return True
         except Exception as e:
             logger.error(f"Failed to connect to Google Sheets: {e}")
             return False
 
-    def get_sheet_name_for_current_month(self) -> str:
-        """Get sheet name for current month."""
-        now = datetime.now(self.timezone)
-        return f"{self.months_ru[now.month]} {now.year}"
-
-    def find_date_column_index(self, headers: list, today: datetime) -> int:
-        """Find column index for today's date."""
-        today_str = today.strftime("%d.%m")
-        logger.info(f"Looking for date column: {today_str}")
+    def use_credentials(self, credentials_file: str):
+        """Switch to another service account; snapshots of the same spreadsheet stay cached."""
+        with self._lock:
+            self.credentials_file = credentials_file
+            # Переподключится фоновое обслуживание или первый запрос
+            self.client = None
+            self.credentials = None
+            self.spreadsheet = None
+
+    def refresh_token_if_needed(self) -> bool:
+        """Refresh the OAuth token ahead of expiry so requests never pay for it."""
+        creds = self.credentials
+        if creds is None:
+            return False
 
-        for i, header in enumerate(headers):
-            header_str = str(header).strip()
-            if header_str == today_str:
-                logger.info(f"Found date column at index {i}: {header_str}")
-                return i
+        # expiry is a naive UTC datetime
+        if creds.token and creds.expiry and creds.expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+            return False
 
-        logger.warning(f"Date column for {today_str} not found")
-        return -1
+        with TRACER.span("sheets.auth"):
+            creds.refresh(Request())
+        logger.info(f"🔑 Google access token refreshed, valid until {creds.expiry} UTC")
+        return True
+
+    def get_spreadsheet(self):
+        """Get the cached spreadsheet handle, opening it (one metadata fetch) on first use."""
+        with self._lock:
+            if self.spreadsheet is None:
+                spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+                metadata = SpreadsheetMetadata(spreadsheet)
+                metadata.load()
+                self.spreadsheet, self.metadata = spreadsheet, metadata
+            return self.spreadsheet
+
+    def maintain(self):
+        """Background upkeep: refresh the token early and revalidate cached metadata."""
+        if not self.client:
+            if not self.connect():
+                return
 
-    def get_cell_color(self, worksheet, row: int, col: int):
-        """Get cell background color."""
         try:
-            # Convert column number to letter (A, B, C, ...)
-            if col <= 26:
-                col_letter = chr(64 + col)
-            else:
-                first = chr(64 + (col - 1) // 26)
-                second = chr(65 + (col - 1) % 26)
-                col_letter = f"{first}{second}"
-
-            cell_label = f"{col_letter}{row}"
-            cell_format = get_effective_format(worksheet, cell_label)
-
-            if cell_format and hasattr(cell_format, 'backgroundColor'):
-                bg = cell_format.backgroundColor
-
-                red = getattr(bg, 'red', 0.0)
-                green = getattr(bg, 'green', 0.0)
-                blue = getattr(bg, 'blue', 0.0)
-
-                red = red if red is not None else 0.0
-                green = green if green is not None else 0.0
-                blue = blue if blue is not None else 0.0
-
-                return {
-                    'red': float(red),
-                    'green': float(green),
-                    'blue': float(blue)
-                }
+            self.refresh_token_if_needed()
+            if self.metadata is None:
+                self.get_spreadsheet()
+            elif self.metadata.refresh_if_changed():
+                logger.info(f"Spreadsheet revision changed to {self.metadata.revision}")
+            self.refresh_snapshots()
         except Exception as e:
-            logger.debug(f"Error getting color for {cell_label}: {e}")
+            logger.error(f"Google Sheets maintenance failed: {e}")
+
+    def refresh_snapshots(self) -> List[str]:
+        """Re-read current and next month rosters that are missing or behind the revision."""
+        today = _as_date(datetime.now(self.timezone))
+        first_day = today.replace(day=1)
+        next_first = _month_end(first_day) + timedelta(days=1)
+
+        # Ревизия общая для всей таблицы: снимки с ней подтверждены проверкой
+        self._mark_validated(self.metadata.revision, self.metadata.checked_at)
+
+        stale = []
+        for month_start in (first_day, next_first):
+            sheet_name = self.get_sheet_name_for_date(month_start)
+            if sheet_name not in self.metadata.sheets:
+                continue
+            roster = self.rosters.get(sheet_name)
+            if roster is None or roster.revision != self.metadata.revision:
+                stale.append(month_start)
+
+        if stale:
+            # Один запрос на все устаревшие месяцы
+            self.get_duty_range(stale[0], _month_end(stale[-1]))
+        return [self.get_sheet_name_for_date(d) for d in stale]
+
+    def _mark_validated(self, revision: Optional[int], at: float):
+        if revision is None:
+            return
+        for roster in list(self.rosters.values()):
+            if roster.revision == revision:
+                roster.mark_validated(at)
+
+    def refresh_month(self, day) -> Optional[MonthRoster]:
+        """Bring the month snapshot containing the day up to date.
+
+        If the Drive revision still matches the snapshot, only its validation
+        time moves; otherwise the whole sheet is re-read. Returns the current
+        snapshot, None if it could not be updated.
+        """
+        first_day = _as_date(day).replace(day=1)
+        sheet_name = self.get_sheet_name_for_date(first_day)
+        previous = self.rosters.get(sheet_name)
+
+        metadata = self.metadata
+        if previous is not None and previous.revision is not None and metadata is not None:
+            # refresh_if_changed заодно перечитывает список листов при новой ревизии
+            metadata.refresh_if_changed()
+            if metadata.revision == previous.revision:
+                self._mark_validated(metadata.revision, metadata.checked_at)
+                return previous
+
+        self.get_duty_range(first_day, _month_end(first_day))
+
+        roster = self.rosters.get(sheet_name)
+        return roster if roster is not previous else None
 
-        return None
+    def get_sheet_name_for_current_month(self) -> str:
+        """Get sheet name for current month."""
+        return self.get_sheet_name_for_date(datetime.now(self.timezone))
+
+    def get_sheet_name_for_date(self, day: datetime) -> str:
+        """Get sheet name for the month containing the given date."""
+        return f"{self.months_ru[day.month]} {day.year}"
+
+    def get_header_index(self, sheet_name: str, headers: list, day: datetime) -> DateColumnIndex:
+        """Get the date -> column index for a sheet, rebuilding it only when headers change."""
+        key = tuple(headers)
+        cached = self._header_indexes.get(sheet_name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        index = DateColumnIndex(headers, day.year, day.month)
+        self._header_indexes[sheet_name] = (key, index)
+        logger.debug(f"Built date index for '{sheet_name}': {len(index)} date columns")
+        return index
 
     @staticmethod
     def is_colored(color_dict) -> bool:
@@ -178,107 +523,356 @@ class GoogleSheetsClient:
         except (TypeError, ZeroDivisionError):
             return False
 
-    def get_today_duty(self) -> str:
-        """Get today's duty information from spreadsheet."""
-        today = datetime.now(self.timezone)
-        sheet_name = self.get_sheet_name_for_current_month()
+    def get_duty(self, day: Optional[datetime] = None) -> DutyResult:
+        """Read duty assignments for a day (today by default) without formatting.
+
+        Uses a ranged read: the date column is resolved from the cached header
+        row and only the name column and that day's column are fetched.
+        """
+        today = _as_date(day or datetime.now(self.timezone))
+        result = DutyResult(today)
+        sheet_name = self.get_sheet_name_for_date(today)
 
-        logger.info(f"Looking for sheet: '{sheet_name}'")
+        if not self.circuit.allow():
+            result.error = "❌ Google Sheets временно недоступен, попробуйте позже"
+            return result
 
         if not self.client:
             if not self.connect():
-                return "❌ Не удалось подключиться к Google Sheets"
+                self.circuit.record_failure("connect failed")
+                result.error = "❌ Не удалось подключиться к Google Sheets"
+                return result
 
         try:
-            spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+            spreadsheet = self.get_spreadsheet()
+            columns = self.fetch_day_columns(spreadsheet, sheet_name, today)
+        except Exception as e:
+            logger.error(f"Error reading spreadsheet: {e}", exc_info=True)
+            self.circuit.record_failure(e)
+            result.error = f"❌ Ошибка при чтении таблицы: {str(e)}"
+            return result
+
+        self.circuit.record_success()
+
+        if columns is None:
+            result.error = (f"❌ Не найден лист '{sheet_name}'.\n"
+                            f"Доступные листы: {', '.join(self.metadata.titles)}")
+            return result
+
+        headers, names, cells = columns
+        if len(names) < 2:
+            result.error = "❌ Лист пустой или содержит только заголовки"
+            return result
+
+        if cells is None:
+            result.error = (f"❌ Не найден столбец с датой {today.strftime('%d.%m')}.\n"
+                            f"Заголовки: {headers[:10]}...")
+            return result
+
+        # Первая строка - заголовки
+        for i in range(1, len(names)):
+            name = str(names[i][0][0]).strip() if names[i] else ""
+            if not name:
+                continue
+            value, color = cells[i][0] if i < len(cells) and cells[i] else ("", None)
+            result.add(name, self.classify_cell(color, str(value)))
+
+        logger.info("%s: found %d leaders, %d followers, %d on vacation (ranged read)",
+                    today.strftime('%d.%m.%Y'), len(result.leaders),
+                    len(result.followers), len(result.vacation), extra={'sample': True})
+        return result
+
+    def fetch_day_columns(self, spreadsheet, sheet_name: str, day: date):
+        """Fetch the name column and a day's column of a sheet.
+
+        Returns ``(headers, names, cells)`` with column rows as lists of
+        ``(value, color)`` cells, ``cells`` being None when the day has no
+        column, or None when the sheet does not exist.
+        """
+        metadata = self.metadata
+        if sheet_name not in metadata.sheets and time_module.time() - metadata.checked_at > MISSING_SHEET_RECHECK:
+            metadata.refresh_if_changed()
+        if sheet_name not in metadata.sheets:
+            return None
+
+        sheet = a1_sheet(sheet_name)
+        headers = self._cached_header_row(sheet_name)
+
+        # Вторая попытка - если столбцы сдвинулись после кэширования заголовков
+        for _ in range(2):
+            if headers is None:
+                header_rows = self._fetch_ranges(spreadsheet, [f"{sheet}!1:1"])[0]
+                headers = [value for value, _ in header_rows[0]] if header_rows else []
+                self._header_rows[sheet_name] = (metadata.revision, headers)
+
+            col = self.get_header_index(sheet_name, headers, day).column_for(day)
+            if col == -1:
+                names = self._fetch_ranges(spreadsheet, [f"{sheet}!A:A"])[0]
+                return headers, names, None
+
+            letter = column_letter(col)
+            names, cells = self._fetch_ranges(spreadsheet, [f"{sheet}!A:A", f"{sheet}!{letter}:{letter}"])
+
+            header_value = cells[0][0][0] if cells and cells[0] else ""
+            if parse_header_date(header_value, day.year, day.month) == day:
+                return headers, names, cells
+
+            logger.info(f"Header of '{sheet_name}' changed, re-reading it")
+            self._header_rows.pop(sheet_name, None)
+            headers = None
+
+        return headers, names, None
+
+    def _cached_header_row(self, sheet_name: str) -> Optional[list]:
+        """Header row cached for the current spreadsheet revision."""
+        cached = self._header_rows.get(sheet_name)
+        if cached and cached[0] == self.metadata.revision:
+            return cached[1]
+        return None
 
-            # Find worksheet for current month
-            try:
-                worksheet = spreadsheet.worksheet(sheet_name)
-            except gspread.WorksheetNotFound:
-                all_worksheets = spreadsheet.worksheets()
-                worksheet_names = [w.title for w in all_worksheets]
-                return f"❌ Не найден лист '{sheet_name}'.\nДоступные листы: {', '.join(worksheet_names)}"
+    def get_duty_range(self, start, end) -> Dict[date, DutyResult]:
+        """Read duty assignments for every day in [start, end].
 
-            # Get all values
-            all_values = worksheet.get_all_values()
+        All month sheets touched by the range are fetched with a single API
+        call and merged into one timeline keyed by date.
+        """
+        start, end = _as_date(start), _as_date(end)
+        return self.get_duty_days([start + timedelta(days=n) for n in range((end - start).days + 1)])
 
-            if not all_values or len(all_values) < 2:
-                return "❌ Лист пустой или содержит только заголовки"
+    def get_duty_days(self, days: List[date]) -> Dict[date, DutyResult]:
+        """Read duty assignments for the given days, not necessarily adjacent.
 
-            # Headers are first row
-            headers = all_values[0]
-
-            # Find today's date column
-            date_col = self.find_date_column_index(headers, today)
-
-            if date_col == -1:
-                sample_headers = headers[:10]
-                return (f"❌ Не найден столбец с датой {today.strftime('%d.%m')}.\n"
-                        f"Заголовки: {sample_headers}...")
-
-            # Employee column is first (index 0)
-            employee_col = 0
-
-            # Collect leaders and followers
-            leaders = []
-            followers = []
-            vacation = []
-
-            # Process each employee row
-            for row_idx, row in enumerate(all_values[1:], start=2):
-                if len(row) <= max(employee_col, date_col):
-                    continue
-
-                employee_name = row[employee_col].strip() if len(row) > employee_col else ""
-
-                if not employee_name:
-                    continue
-
-                # Get cell color
-                cell_color = self.get_cell_color(worksheet, row_idx, date_col + 1)
-
-                if cell_color and self.is_colored(cell_color):
-                    # Check for yellow (vacation) - ignore
-                    if self.is_yellow_color(cell_color):
-                        vacation.append(employee_name)
-                        logger.info(f"🏖️ VACATION: {employee_name} (ignored)")
-                    # Check for green (leader)
-                    elif self.is_green_color(cell_color):
-                        leaders.append(employee_name)
-                        logger.info(f"✅ LEADER: {employee_name}")
-                    # Other colors - followers
-                    else:
-                        followers.append(employee_name)
-                        logger.info(f"📌 FOLLOWER: {employee_name}")
-                else:
-                    # Fallback to text content
-                    cell_value = row[date_col].strip() if len(row) > date_col else ""
-                    if cell_value:
-                        followers.append(employee_name)
-                        logger.info(f"📝 TEXT ONLY: {employee_name}")
-
-            date_str = today.strftime("%d.%m.%Y")
-            logger.info(f"Found {len(leaders)} leaders, {len(followers)} followers, {len(vacation)} on vacation")
-
-            if not leaders and not followers:
-                return f"ℹ️ На {date_str} дежурные не назначены."
-
-            # Format message
-            message_parts = [f"📋 <b>Дежурство на {date_str}</b>"]
-
-            if leaders:
-                leaders_list = "\n".join([f"• {name}" for name in leaders])
-                leader_word = "Ведущий" if len(leaders) == 1 else "Ведущие"
-                message_parts.append(f"👤 <b>{leader_word}:</b>\n{leaders_list}")
-
-            if followers:
-                followers_list = "\n".join([f"• {name}" for name in followers])
-                follower_word = "Ведомый" if len(followers) == 1 else "Ведомые"
-                message_parts.append(f"👥 <b>{follower_word}:</b>\n{followers_list}")
-
-            return "\n\n".join(message_parts)
+        Whole month sheets are fetched (one API call for all of them), so the
+        first day of each month is enough to refresh its roster snapshot.
+        """
+        days = [_as_date(d) for d in days]
+        timeline = {d: DutyResult(d) for d in days}
+        sheet_names = list(dict.fromkeys(self.get_sheet_name_for_date(d) for d in days))
+
+        logger.debug("Looking for sheets: %s", sheet_names)
 
+        if not self.circuit.allow():
+            for result in timeline.values():
+                result.error = "❌ Google Sheets временно недоступен, попробуйте позже"
+            return timeline
+
+        if not self.client:
+            if not self.connect():
+                self.circuit.record_failure("connect failed")
+                for result in timeline.values():
+                    result.error = "❌ Не удалось подключиться к Google Sheets"
+                return timeline
+
+        try:
+            spreadsheet = self.get_spreadsheet()
+            grids, available = self.fetch_grids(spreadsheet, sheet_names)
         except Exception as e:
             logger.error(f"Error reading spreadsheet: {e}", exc_info=True)
-            return f"❌ Ошибка при чтении таблицы: {str(e)}"
\ No newline at end of file
+            self.circuit.record_failure(e)
+            for result in timeline.values():
+                result.error = f"❌ Ошибка при чтении таблицы: {str(e)}"
+            return timeline
+
+        self.circuit.record_success()
+
+        revision = self.metadata.revision if self.metadata else None
+        month_days = {self.get_sheet_name_for_date(d): d for d in reversed(days)}
+        headers_by_sheet = {}
+
+        for sheet_name, grid in grids.items():
+            if len(grid) < 2:
+                continue
+
+            # Headers are first row
+            headers = [value for value, _ in grid[0]]
+            headers_by_sheet[sheet_name] = headers
+            self._header_rows[sheet_name] = (revision, headers)
+            index = self.get_header_index(sheet_name, headers, month_days[sheet_name])
+            date_columns = [(d, index.columns[d]) for d in index.dates()]
+            with TRACER.span("roster.build", sheet=sheet_name) as span:
+                self.rosters[sheet_name] = MonthRoster.from_grid(
+                    sheet_name, grid, date_columns, self.classify_cell, revision
+                )
+                span.set("employees", len(self.rosters[sheet_name].names))
+
+        for day, result in timeline.items():
+            sheet_name = self.get_sheet_name_for_date(day)
+
+            if sheet_name not in grids:
+                result.error = f"❌ Не найден лист '{sheet_name}'.\nДоступные листы: {', '.join(available)}"
+                continue
+
+            if sheet_name not in headers_by_sheet:
+                result.error = "❌ Лист пустой или содержит только заголовки"
+                continue
+
+            roster = self.rosters[sheet_name]
+            if day not in roster:
+                sample_headers = headers_by_sheet[sheet_name][:10]
+                result.error = (f"❌ Не найден столбец с датой {day.strftime('%d.%m')}.\n"
+                                f"Заголовки: {sample_headers}...")
+                continue
+
+            self._collect_day(result, roster)
+
+        return timeline
+
+    def evict_rosters(self, keep: int) -> List[str]:
+        """Drop the oldest snapshots beyond ``keep``, except the current and next month."""
+        first_day = _as_date(datetime.now(self.timezone)).replace(day=1)
+        pinned = {self.get_sheet_name_for_date(first_day),
+                  self.get_sheet_name_for_date(_month_end(first_day) + timedelta(days=1))}
+        extra = sorted((roster for name, roster in list(self.rosters.items()) if name not in pinned),
+                       key=lambda roster: roster.fetched_at, reverse=True)
+        evicted = [roster.sheet_name for roster in extra[max(keep, 0):]]
+        for sheet_name in evicted:
+            self.rosters.pop(sheet_name, None)
+        if evicted:
+            logger.debug("Evicted roster snapshots: %s", evicted)
+        return evicted
+
+    def get_roster(self, sheet_name: str) -> Optional[MonthRoster]:
+        """Latest roster snapshot of a month sheet, if it was read before."""
+        return self.rosters.get(sheet_name)
+
+    def get_cached_duty(self, day) -> Optional[DutyResult]:
+        """Duty for a day from roster snapshots only, None if the day is not cached."""
+        day = _as_date(day)
+        roster = self.rosters.get(self.get_sheet_name_for_date(day))
+        if roster is None or day not in roster:
+            return None
+
+        result = DutyResult(day)
+        for employee_name, role in roster.day(day):
+            result.add(employee_name, role)
+        return result
+
+    def fetch_grids(self, spreadsheet, sheet_names: List[str]) -> Tuple[Dict[str, list], List[str]]:
+        """Fetch values and background colors of several worksheets in one API call.
+
+        Only sheets known to the cached metadata are requested. Returns grids
+        as ``{title: [[(value, color), ...], ...]}`` and the available sheet titles.
+        """
+        metadata = self.metadata
+        missing = any(name not in metadata.sheets for name in sheet_names)
+        if missing and time_module.time() - metadata.checked_at > MISSING_SHEET_RECHECK:
+            # Возможно, лист только что создан - сверяем ревизию
+            metadata.refresh_if_changed()
+
+        existing = [name for name in sheet_names if name in metadata.sheets]
+        if not existing:
+            return {}, metadata.titles
+
+        try:
+            return self._fetch_grids(spreadsheet, existing), metadata.titles
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code != 400:
+                raise
+            # Лист удалён или переименован после загрузки метаданных
+            metadata.load()
+            existing = [name for name in sheet_names if name in metadata.sheets]
+            if not existing:
+                return {}, metadata.titles
+            return self._fetch_grids(spreadsheet, existing), metadata.titles
+
+    @staticmethod
+    def _fetch_grids(spreadsheet, sheet_names: List[str]) -> Dict[str, list]:
+        params = {
+            "ranges": [a1_sheet(name) for name in sheet_names],
+            "includeGridData": "true",
+            "fields": GRID_FIELDS,
+        }
+        with TRACER.span("sheets.grids", sheets=len(sheet_names)) as span:
+            metadata = spreadsheet.fetch_sheet_metadata(params=params)
+
+            grids = {}
+            for sheet in metadata.get("sheets", []):
+                rows = []
+                for data in sheet.get("data", []):
+                    rows.extend(GoogleSheetsClient._parse_rows(data))
+                grids[sheet["properties"]["title"]] = rows
+            span.set("rows", sum(len(rows) for rows in grids.values()))
+        return grids
+
+    @staticmethod
+    def _fetch_ranges(spreadsheet, ranges: List[str]) -> List[list]:
+        """Fetch values and colors of A1 ranges of one sheet, one row list per range."""
+        params = {
+            "ranges": ranges,
+            "includeGridData": "true",
+            "fields": GRID_FIELDS,
+        }
+        with TRACER.span("sheets.ranges", ranges=len(ranges)) as span:
+            metadata = spreadsheet.fetch_sheet_metadata(params=params)
+
+            # Для диапазонов одного листа ответ содержит один лист с data в порядке ranges
+            columns = [
+                GoogleSheetsClient._parse_rows(data)
+                for sheet in metadata.get("sheets", [])
+                for data in sheet.get("data", [])
+            ]
+            span.set("rows", sum(len(rows) for rows in columns))
+        return columns
+
+    @staticmethod
+    def _parse_rows(data: dict) -> list:
+        return [
+            [(cell.get("formattedValue", ""), cell.get("effectiveFormat", {}).get("backgroundColor"))
+             for cell in row.get("values", [])]
+            for row in data.get("rowData", [])
+        ]
+
+    @staticmethod
+    def _collect_day(result: DutyResult, roster: MonthRoster):
+        """Fill a day's result from the roster snapshot."""
+        for employee_name, role in roster.day(_as_date(result.date)):
+            result.add(employee_name, role)
+
+        # Детали по сотрудникам - одной строкой и только на DEBUG
+        logger.debug("%s: leaders=%s followers=%s vacation=%s",
+                     result.date, result.leaders, result.followers, result.vacation)
+        logger.info("%s: found %d leaders, %d followers, %d on vacation",
+                    result.date.strftime('%d.%m.%Y'), len(result.leaders),
+                    len(result.followers), len(result.vacation), extra={'sample': True})
+
+    @classmethod
+    def classify_cell(cls, color, value: str) -> int:
+        """Map a cell's background color and text to a duty role."""
+        if color and cls.is_colored(color):
+            # Check for yellow (vacation) - ignore
+            if cls.is_yellow_color(color):
+                return ROLE_VACATION
+            # Check for green (leader)
+            if cls.is_green_color(color):
+                return ROLE_LEADER
+            # Other colors - followers
+            return ROLE_FOLLOWER
+
+        # Fallback to text content
+        return ROLE_FOLLOWER if value.strip() else ROLE_NONE
+
+    @staticmethod
+    def format_duty(result: DutyResult) -> str:
+        """Render duty assignments as an HTML message."""
+        if result.error:
+            return result.error
+
+        date_str = result.date.strftime("%d.%m.%Y")
+
+        if not result.has_duty:
+            return f"ℹ️ На {date_str} дежурные не назначены."
+
+        # Format message
+        message_parts = [f"📋 <b>Дежурство на {date_str}</b>"]
+
+        if result.leaders:
+            leaders_list = "\n".join([f"• {name}" for name in result.leaders])
+            leader_word = "Ведущий" if len(result.leaders) == 1 else "Ведущие"
+            message_parts.append(f"👤 <b>{leader_word}:</b>\n{leaders_list}")
+
+        if result.followers:
+            followers_list = "\n".join([f"• {name}" for name in result.followers])
+            follower_word = "Ведомый" if len(result.followers) == 1 else "Ведомые"
+            message_parts.append(f"👥 <b>{follower_word}:</b>\n{followers_list}")
+
+        return "\n\n".join(message_parts)
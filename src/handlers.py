@@ -1,10 +1,12 @@
 """
 Telegram command handlers.
 """
+import html
 import logging
 from datetime import datetime, time
 import pytz
-from telegram import Update
+from telegram import Chat, Update, InlineQueryResultArticle, InputTextMessageContent, ReplyParameters
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
 logger = logging.getLogger(__name__)
@@ -12,7 +14,43 @@ logger = logging.getLogger(__name__)
 import asyncio
 from datetime import datetime, timedelta
 import time as time_module
+from typing import Dict, List, Optional, Tuple
+from google_sheets import GoogleSheetsClient
 from holiday_api import ProductionCalendarAPI, MSK_TZ
+from outbox import OutboundQueue, OutboxFull, PRIORITY_NOTIFICATION, PRIORITY_ADMIN, PRIORITY_USER
+from roster import ROLE_LEADER, ROLE_FOLLOWER
+from scheduler import WorkdayPlanner, WorkdayTrigger
+from search import EmployeeIndex
+from snapshots import DutySnapshotService
+from stats import StatsIndex, parse_period
+from tracing import TRACER, traced
+from subscriptions import SubscriptionStore, DutyIndex, resolve_name, MODE_ALIASES, MODE_EVENING, MODE_MORNING
+
+ROLE_NAMES = {ROLE_LEADER: "ведущий"}
+WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+# Reaction on a /duty request answered by a recent reply in the same chat
+DUTY_COALESCED_REACTION = "👌"
+
+# Telegram allows ~30 messages per second across chats: reminders go out
+# as concurrent batches of this size, one batch per second
+SUBSCRIPTION_BATCH_SIZE = 25
+
+
+# Background jobs that are not affected by switching test/production mode
+SERVICE_JOBS = {"sheets_maintenance", "subscriptions_evening", "subscriptions_morning"}
+
+# Settings that change the notification plan
+PLAN_SETTINGS = {"NOTIFY_HOUR", "NOTIFY_MINUTE", "NOTIFY_SHORT_DAY_HOUR", "NOTIFY_SHORT_DAY_MINUTE",
+                 "WORKDAY_PLAN_DAYS", "NOTIFY_PREPARE_MINUTES"}
+
+
+def format_age(seconds: float) -> str:
+    """Human-readable age: '5 мин', '2 ч 10 мин'."""
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{max(minutes, 1)} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
 
 
 class RateLimiter:
@@ -42,6 +80,29 @@ class RateLimiter:
         self.calls.append(now)
 
 
+class PreparedNotification:
+    """Ready-to-send notification payload produced by the prepare phase."""
+
+    def __init__(self, date: datetime, is_working: bool, day_type: str, text: Optional[str],
+                 problems: List[str], failed: bool = False):
+        self.date = date
+        self.is_working = is_working
+        self.day_type = day_type
+        self.text = text
+        self.problems = problems
+        # Чтение графика не удалось: такой payload не кэшируется, при отправке читаем заново
+        self.failed = failed
+        self.prepared_at = time_module.time()
+
+    @property
+    def age(self) -> float:
+        return time_module.time() - self.prepared_at
+
+    def is_valid_for(self, now: datetime, max_age: float) -> bool:
+        """Check that the payload was prepared for this day and is not too old."""
+        return self.date.date() == now.date() and self.age <= max_age
+
+
 class DutyBotHandlers:
     """Handlers for Telegram bot commands."""
 
@@ -52,19 +113,76 @@ class DutyBotHandlers:
         self.moscow_tz = pytz.timezone('Europe/Moscow')
         self.rate_limiter = RateLimiter(max_calls_per_minute=1)
         self.calendar_api = ProductionCalendarAPI()
+        self.planner = self._build_planner()
+        self.workday_plan: List[WorkdayTrigger] = []
+        self.subscriptions = SubscriptionStore(config.SUBSCRIPTIONS_FILE)
+        self.subscriptions.load()
+        self.duty_index = DutyIndex()
+        self.employees = EmployeeIndex()
+        self.stats = StatsIndex()
+        self._stats_lock = asyncio.Lock()
+        self.snapshots = DutySnapshotService(google_client, config.SNAPSHOT_SOFT_TTL, config.SNAPSHOT_HARD_TTL)
+        self.outbox = OutboundQueue(workers=config.OUTBOX_WORKERS, maxsize=config.OUTBOX_MAXSIZE)
+        self._duty_replies = {}
+        # Serializes changes of the mode and the notification jobs
+        self._mode_lock = asyncio.Lock()
+
+    def _build_planner(self) -> WorkdayPlanner:
+        config = self.config
+        return WorkdayPlanner(
+            self.calendar_api,
+            self.moscow_tz,
+            notify_time=time(hour=config.NOTIFY_HOUR, minute=config.NOTIFY_MINUTE),
+            short_day_time=time(hour=int(config.NOTIFY_SHORT_DAY_HOUR), minute=config.NOTIFY_SHORT_DAY_MINUTE)
+            if config.NOTIFY_SHORT_DAY_HOUR else None,
+            days_ahead=config.WORKDAY_PLAN_DAYS
+        )
+
+    def _priority_for(self, update: Update) -> int:
+        if update.effective_user and update.effective_user.id == self.config.ADMIN_USER_ID:
+            return PRIORITY_ADMIN
+        return PRIORITY_USER
+
+    async def reply_text(self, update: Update, text: str, **kwargs):
+        """Reply to the update's message through the outbound queue."""
+        message = update.effective_message
+
+        # Как Message.reply_text: в группах отвечаем цитатой
+        if message.chat.type != Chat.PRIVATE:
+            kwargs.setdefault('reply_parameters',
+                              ReplyParameters(message.message_id, allow_sending_without_reply=True))
+        if message.is_topic_message:
+            kwargs.setdefault('message_thread_id', message.message_thread_id)
+
+        try:
+            return await self.outbox.send_message(self._priority_for(update), message.chat_id, text, **kwargs)
+        except OutboxFull:
+            logger.warning(f"Reply to chat {message.chat_id} dropped: outbound queue is full")
+            return None
+
+    async def reply_html(self, update: Update, text: str, **kwargs):
+        return await self.reply_text(update, text, parse_mode="HTML", **kwargs)
+
+    async def today_duty_message(self) -> str:
+        """Today's duty from the latest snapshot, with its age if it is getting old."""
+        duty, age = await self.snapshots.get_duty(datetime.now(self.moscow_tz))
+        message = self.google_client.format_duty(duty)
+        if age is not None and age > self.config.SNAPSHOT_SHOW_AGE_AFTER:
+            message += f"\n\n🕒 <i>Данные графика обновлены {format_age(age)} назад</i>"
+        return message
 
     async def cmd_duty(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler for /duty command - max 1 per minute with hard protection."""
         user_id = update.effective_user.id
-        logger.info(f"Command /duty from user {user_id}")
+        logger.info("Command /duty from user %s", user_id, extra={'sample': True})
 
         # Админу можно всё - проверка в САМОМ НАЧАЛЕ
         if user_id == self.config.ADMIN_USER_ID:
-            logger.info(f"Admin user {user_id} - bypassing rate limit")
-            message = self.google_client.get_today_duty()
+            logger.debug("Admin user %s - bypassing rate limit", user_id)
+            message = await self.today_duty_message()
             link_text = f'<a href="{self.config.SPREADSHEET_URL}">📅 Открыть график дежурств</a>'
             full_message = f"{link_text}\n\n{message}"
-            await update.message.reply_html(full_message, disable_web_page_preview=True)
+            await self.reply_html(update, full_message, disable_web_page_preview=True)
             return
 
         # Для обычных пользователей - жесткая проверка
@@ -72,33 +190,71 @@ class DutyBotHandlers:
         current_time = time_module.time()
         last_call = context.bot_data.get(last_call_key, 0)
 
-        logger.info(f"User {user_id} - last call: {last_call:.0f}, current: {current_time:.0f}, diff: {current_time - last_call:.0f}s")
+        logger.debug("User %s - last call: %.0f, current: %.0f, diff: %.0fs",
+                     user_id, last_call, current_time, current_time - last_call)
 
         # Если прошло меньше 60 секунд с последнего вызова
         if current_time - last_call < 60:
             wait_time = 60 - (current_time - last_call)
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 f"⏳ <b>Слишком много запросов</b>\n\n"
                 f"Команда /duty доступна не чаще 1 раза в минуту.\n"
                 f"Пожалуйста, подождите {wait_time:.0f} секунд.",
                 parse_mode="HTML"
             )
-            logger.warning(f"Rate limit triggered for user {user_id}, wait {wait_time:.0f}s")
+            logger.info("Rate limit triggered for user %s, wait %.0fs", user_id, wait_time, extra={'sample': True})
             return
 
         # Обновляем время последнего вызова ДО выполнения команды
         context.bot_data[last_call_key] = current_time
-        logger.info(f"User {user_id} - updated last call time to {current_time:.0f}")
+        logger.debug("User %s - updated last call time to %.0f", user_id, current_time)
+
+        # Выполняем команду (с объединением запросов в чате)
+        await self.reply_duty_coalesced(update)
 
-        # Выполняем команду
-        message = self.google_client.get_today_duty()
+    async def reply_duty_coalesced(self, update: Update):
+        """Reply to /duty, or mark the request with a reaction if the chat got a reply within the window.
+
+        Updates of one chat are handled in order, so a reply is always sent
+        before the next request is looked at. A coalesced request costs one
+        setMessageReaction call instead of another message in the chat.
+        """
+        chat_id = update.effective_chat.id
+        recent = self._duty_replies.get(chat_id)
+
+        if recent and time_module.monotonic() - recent['at'] < self.config.DUTY_COALESCE_WINDOW:
+            message = update.effective_message
+            try:
+                await self.outbox.call(
+                    self._priority_for(update), "set_message_reaction",
+                    chat_id=chat_id, message_id=message.message_id, reaction=DUTY_COALESCED_REACTION
+                )
+                logger.debug(f"Coalesced /duty in chat {chat_id} into message {recent['message_id']}")
+                return
+            except OutboxFull:
+                return
+            except TelegramError as e:
+                # Реакции в чате запрещены или ограничены - отвечаем ссылкой на сообщение
+                logger.debug(f"Reaction in chat {chat_id} failed: {e}")
+            await self.reply_text(
+                update,
+                "📌 Актуальный график — в сообщении выше",
+                reply_parameters=ReplyParameters(recent['message_id'], allow_sending_without_reply=True)
+            )
+            return
+
+        message = await self.today_duty_message()
         link_text = f'<a href="{self.config.SPREADSHEET_URL}">📅 Открыть график дежурств</a>'
         full_message = f"{link_text}\n\n{message}"
 
-        await update.message.reply_html(
+        sent = await self.reply_html(
+            update,
             full_message,
             disable_web_page_preview=True,
         )
+        if sent is not None:
+            self._duty_replies[chat_id] = {'at': time_module.monotonic(), 'message_id': sent.message_id}
 
     async def cmd_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler for /time command."""
@@ -108,13 +264,15 @@ class DutyBotHandlers:
 
         # Для админа показываем дополнительную информацию
         if user_id == self.config.ADMIN_USER_ID:
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 f"🕐 Текущее время: {now.strftime('%d.%m.%Y %H:%M:%S')} MSK\n"
                 f"Режим: {mode_status}\n"
                 f"Ваш ID: {user_id} (админ)"
             )
         else:
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 f"🕐 Текущее время: {now.strftime('%d.%m.%Y %H:%M:%S')} MSK\n"
                 f"Режим: {mode_status}"
             )
@@ -122,12 +280,12 @@ class DutyBotHandlers:
     async def cmd_test(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler for /test command - max 1 per minute."""
         user_id = update.effective_user.id
-        logger.info(f"Command /test from user {user_id}")
+        logger.info("Command /test from user %s", user_id, extra={'sample': True})
 
         # Админу можно всё
         if user_id == self.config.ADMIN_USER_ID:
-            message = self.google_client.get_today_duty()
-            await update.message.reply_html(f"🧪 ТЕСТОВОЕ\n\n{message}")
+            message = await self.today_duty_message()
+            await self.reply_html(update, f"🧪 ТЕСТОВОЕ\n\n{message}")
             return
 
         # Для обычных пользователей - проверка
@@ -137,7 +295,8 @@ class DutyBotHandlers:
 
         if current_time - last_call < 60:
             wait_time = 60 - (current_time - last_call)
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 f"⏳ <b>Слишком много запросов</b>\n\n"
                 f"Команда /test доступна не чаще 1 раза в минуту.\n"
                 f"Пожалуйста, подождите {wait_time:.0f} секунд.",
@@ -146,8 +305,8 @@ class DutyBotHandlers:
             return
 
         context.bot_data[last_call_key] = current_time
-        message = self.google_client.get_today_duty()
-        await update.message.reply_html(f"🧪 ТЕСТОВОЕ\n\n{message}")
+        message = await self.today_duty_message()
+        await self.reply_html(update, f"🧪 ТЕСТОВОЕ\n\n{message}")
 
     async def cmd_chatid(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show current chat ID (для диагностики)."""
@@ -168,7 +327,7 @@ class DutyBotHandlers:
         except:
             message += f"Статус бота: не в чате\n"
 
-        await update.message.reply_html(message)
+        await self.reply_html(update, message)
 
     async def cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler for /status command."""
@@ -177,7 +336,12 @@ class DutyBotHandlers:
 
         jobs_info = []
         if context.job_queue:
+            seen = set()
             for job in context.job_queue.jobs():
+                # Запланированные рабочие дни показываем ниже, здесь - только ближайший
+                if job.name in seen:
+                    continue
+                seen.add(job.name)
                 next_run = job.next_t if hasattr(job, 'next_t') else "неизвестно"
                 jobs_info.append(f"• {job.name}: {next_run}")
 
@@ -204,12 +368,35 @@ class DutyBotHandlers:
             else:
                 duty_text = "• Вы еще не вызывали /duty"
 
-        await update.message.reply_text(
+        if self.workday_plan and not self.test_mode:
+            plan_text = "\n".join(
+                f"• {trigger.at.strftime('%d.%m.%Y %H:%M')}" + (" (сокращённый)" if trigger.shortened else "")
+                for trigger in self.workday_plan
+                if trigger.at > datetime.now(self.moscow_tz)
+            ) or "Нет запланированных уведомлений"
+        else:
+            plan_text = "Не запланировано"
+
+        swr = self.snapshots.state(datetime.now(self.moscow_tz))
+        snapshot_age = format_age(swr['age']) if swr['age'] is not None else "нет снимка"
+        snapshot_text = (
+            f"• Возраст снимка: {snapshot_age}\n"
+            f"• TTL: {swr['soft_ttl']}s / {swr['hard_ttl']}s\n"
+            f"• Обновление: {'выполняется' if swr['refreshing'] else 'нет'}"
+        )
+        if swr['last_refresh_error']:
+            # В тексте исключений бывают <...> (repr объектов urllib3), а ответ в HTML
+            snapshot_text += f"\n• Ошибка обновления: {html.escape(swr['last_refresh_error'])}"
+
+        await self.reply_text(
+            update,
             f"📊 <b>Статус бота</b>\n\n"
             f"Режим: {mode_status}\n"
             f"Группа: {self.config.GROUP_CHAT_ID}\n"
             f"Время: {self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d} MSK\n\n"
             f"<b>Rate limits:</b>\n{duty_text}\n\n"
+            f"<b>График:</b>\n{snapshot_text}\n\n"
+            f"<b>Рабочие дни:</b>\n{plan_text}\n\n"
             f"<b>Задачи:</b>\n{jobs_text}",
             parse_mode="HTML"
         )
@@ -217,7 +404,7 @@ class DutyBotHandlers:
     async def cmd_reset_rate_limit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Reset rate limit counters (admin only)."""
         if update.effective_user.id != self.config.ADMIN_USER_ID:
-            await update.message.reply_text("⛔ Нет прав")
+            await self.reply_text(update, "⛔ Нет прав")
             return
 
         # Удаляем все ключи с ограничениями
@@ -229,114 +416,355 @@ class DutyBotHandlers:
         for key in keys_to_delete:
             del context.bot_data[key]
 
-        await update.message.reply_text(f"✅ Rate limit counters reset (удалено {len(keys_to_delete)} записей)")
+        await self.reply_text(update, f"✅ Rate limit counters reset (удалено {len(keys_to_delete)} записей)")
 
     async def cmd_test_on(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Turn on test mode (admin only)."""
         if update.effective_user.id != self.config.ADMIN_USER_ID:
-            await update.message.reply_text("⛔ Нет прав")
+            await self.reply_text(update, "⛔ Нет прав")
             return
 
-        if self.test_mode:
-            await update.message.reply_text("⚠️ Тестовый режим уже включен")
-            return
+        async with self._mode_lock:
+            if self.test_mode:
+                await self.reply_text(update, "⚠️ Тестовый режим уже включен")
+                return
 
-        self.test_mode = True
+            self.test_mode = True
 
-        if context.job_queue:
-            # Remove old jobs
-            for job in context.job_queue.jobs():
-                job.schedule_removal()
+            if context.job_queue:
+                # Remove old jobs
+                self.remove_notification_jobs(context.job_queue)
 
-            # Add test jobs
-            context.job_queue.run_once(
-                self.send_notification,
-                when=10,
-                name="test_once"
-            )
-            context.job_queue.run_repeating(
-                self.send_notification,
-                interval=60,
-                first=70,
-                name="test_repeating"
-            )
-
-            await update.message.reply_text(
-                "✅ Тестовый режим ВКЛЮЧЕН\n"
-                "Уведомления каждую минуту"
-            )
+                # Add test jobs
+                self.schedule_test_jobs(context.job_queue)
 
-            try:
-                await context.bot.send_message(
-                    chat_id=self.config.GROUP_CHAT_ID,
-                    text="🔴 <b>Тестовый режим включен</b>\nУведомления каждую минуту",
-                    parse_mode="HTML"
+                await self.reply_text(
+                    update,
+                    "✅ Тестовый режим ВКЛЮЧЕН\n"
+                    "Уведомления каждую минуту"
                 )
-            except:
-                pass
+
+                try:
+                    await self.outbox.send_message(
+                        PRIORITY_ADMIN,
+                        chat_id=self.config.GROUP_CHAT_ID,
+                        text="🔴 <b>Тестовый режим включен</b>\nУведомления каждую минуту",
+                        parse_mode="HTML"
+                    )
+                except:
+                    pass
 
     async def cmd_test_off(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Turn off test mode (admin only)."""
         if update.effective_user.id != self.config.ADMIN_USER_ID:
-            await update.message.reply_text("⛔ Нет прав")
+            await self.reply_text(update, "⛔ Нет прав")
             return
 
-        if not self.test_mode:
-            await update.message.reply_text("⚠️ Тестовый режим уже выключен")
+        async with self._mode_lock:
+            if not self.test_mode:
+                await self.reply_text(update, "⚠️ Тестовый режим уже выключен")
+                return
+
+            self.test_mode = False
+
+            if context.job_queue:
+                # Remove old jobs
+                self.remove_notification_jobs(context.job_queue)
+
+                # Add daily jobs
+                self.schedule_production_jobs(context.job_queue)
+
+                await self.reply_text(
+                    update,
+                    f"✅ Тестовый режим ВЫКЛЮЧЕН\n"
+                    f"Уведомления в {self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d} MSK"
+                )
+
+                try:
+                    await self.outbox.send_message(
+                        PRIORITY_ADMIN,
+                        chat_id=self.config.GROUP_CHAT_ID,
+                        text=f"🟢 <b>Рабочий режим</b>\nУведомления в {self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d} MSK",
+                        parse_mode="HTML"
+                    )
+                except:
+                    pass
+
+    async def cmd_reload(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Re-read configuration and subscriptions without a restart (admin only)."""
+        if update.effective_user.id != self.config.ADMIN_USER_ID:
+            await self.reply_text(update, "⛔ Нет прав")
             return
 
-        self.test_mode = False
+        try:
+            applied, pending = await self.reload_config(context.job_queue)
+        except ValueError as e:
+            await self.reply_text(update, f"❌ Конфигурация не применена: {e}")
+            return
 
-        if context.job_queue:
-            # Remove old jobs
-            for job in context.job_queue.jobs():
+        lines = ["🔄 Конфигурация перечитана"]
+        lines.append("Применено: " + ", ".join(sorted(applied)) if applied else "Изменений нет")
+        if pending:
+            lines.append("Требуют перезапуска: " + ", ".join(sorted(pending)))
+        lines.append(f"Подписок: {len(self.subscriptions.subscriptions)}")
+        await self.reply_text(update, "\n".join(lines))
+
+    async def reload_config(self, job_queue) -> Tuple[Dict[str, tuple], List[str]]:
+        """Re-read configuration and apply it, rescheduling only the affected jobs.
+
+        Clients and caches are kept unless their own settings changed: another
+        spreadsheet gets a new Sheets client, other credentials reconnect the
+        same client and keep its snapshots. Subscriptions are always re-read.
+        """
+        async with self._mode_lock:
+            applied, pending = await asyncio.to_thread(self.config.reload)
+            changed = set(applied)
+
+            if "SPREADSHEET_ID" in changed:
+                self.google_client = GoogleSheetsClient(
+                    credentials_file=self.config.GOOGLE_CREDENTIALS_FILE,
+                    spreadsheet_id=self.config.SPREADSHEET_ID,
+                    timezone=self.moscow_tz,
+                    cassette=self.google_client.cassette
+                )
+                self.snapshots = DutySnapshotService(
+                    self.google_client, self.config.SNAPSHOT_SOFT_TTL, self.config.SNAPSHOT_HARD_TTL
+                )
+                self.stats = StatsIndex()
+                self.duty_index = DutyIndex()
+                self.employees = EmployeeIndex()
+                self._duty_replies.clear()
+            elif "GOOGLE_CREDENTIALS_FILE" in changed:
+                self.google_client.use_credentials(self.config.GOOGLE_CREDENTIALS_FILE)
+
+            self.snapshots.soft_ttl = self.config.SNAPSHOT_SOFT_TTL
+            self.snapshots.hard_ttl = self.config.SNAPSHOT_HARD_TTL
+
+            if changed & {"SHEETS_MAINTENANCE_INTERVAL", "SPREADSHEET_ID", "GOOGLE_CREDENTIALS_FILE"}:
+                # Новый клиент прогревается сразу, а не через интервал
+                self.remove_jobs(job_queue, "sheets_maintenance")
+                self.schedule_maintenance_job(job_queue)
+            if "SUBSCRIPTION_EVENING_HOUR" in changed:
+                self.remove_jobs(job_queue, f"subscriptions_{MODE_EVENING}")
+                self.schedule_digest_job(job_queue, MODE_EVENING)
+            if "SUBSCRIPTION_MORNING_HOUR" in changed:
+                self.remove_jobs(job_queue, f"subscriptions_{MODE_MORNING}")
+                self.schedule_digest_job(job_queue, MODE_MORNING)
+
+            if "SUBSCRIPTIONS_FILE" in changed:
+                self.subscriptions = SubscriptionStore(self.config.SUBSCRIPTIONS_FILE)
+            self.subscriptions.load()
+
+            if changed & PLAN_SETTINGS:
+                # Клиент календаря вместе с кэшем месяцев остаётся прежним
+                self.planner = self._build_planner()
+                if not self.test_mode:
+                    job_queue.run_once(self.plan_notifications, when=0, name="workday_plan_initial")
+
+        logger.info(f"🔄 Configuration reloaded: applied {sorted(applied) or 'nothing'}"
+                    + (f", restart needed for {sorted(pending)}" if pending else ""))
+        return applied, pending
+
+    def schedule_service_jobs(self, job_queue):
+        """Schedule background upkeep jobs that run in every mode."""
+        self.schedule_maintenance_job(job_queue)
+        self.schedule_digest_job(job_queue, MODE_EVENING)
+        self.schedule_digest_job(job_queue, MODE_MORNING)
+
+    def schedule_maintenance_job(self, job_queue, first: float = 1):
+        job_queue.run_repeating(
+            self.maintain_sheets,
+            interval=self.config.SHEETS_MAINTENANCE_INTERVAL,
+            first=first,
+            name="sheets_maintenance"
+        )
+
+    def schedule_digest_job(self, job_queue, mode: str):
+        hour = self.config.SUBSCRIPTION_EVENING_HOUR if mode == MODE_EVENING else self.config.SUBSCRIPTION_MORNING_HOUR
+        job_queue.run_daily(
+            self.send_subscription_digest,
+            time=time(hour=hour, tzinfo=self.moscow_tz),
+            name=f"subscriptions_{mode}",
+            data=mode
+        )
+
+    @staticmethod
+    def remove_jobs(job_queue, name: str):
+        for job in job_queue.get_jobs_by_name(name):
+            job.schedule_removal()
+
+    @staticmethod
+    def remove_notification_jobs(job_queue):
+        """Remove notification jobs, keeping background service jobs."""
+        for job in job_queue.jobs():
+            if job.name not in SERVICE_JOBS:
                 job.schedule_removal()
 
-            # Add daily job
-            notification_time = time(
-                hour=self.config.NOTIFY_HOUR,
-                minute=self.config.NOTIFY_MINUTE,
-                second=0,
-                tzinfo=self.moscow_tz
-            )
+    @traced("job.maintain_sheets", root=True)
+    async def maintain_sheets(self, context: ContextTypes.DEFAULT_TYPE):
+        """Keep the Google token and spreadsheet metadata warm off the request path."""
+        await asyncio.to_thread(self.google_client.maintain)
+
+    def schedule_test_jobs(self, job_queue):
+        """Schedule test mode notifications (every minute)."""
+        job_queue.run_once(
+            self.send_notification,
+            when=10,
+            name="test_once"
+        )
+        job_queue.run_repeating(
+            self.send_notification,
+            interval=60,
+            first=70,
+            name="test_repeating"
+        )
 
-            context.job_queue.run_daily(
-                self.send_notification,
-                time=notification_time,
-                days=tuple(range(7)),
-                name="daily"
-            )
+    def schedule_production_jobs(self, job_queue):
+        """Plan notifications for the next working days and replan them nightly."""
+        job_queue.run_once(self.plan_notifications, when=0, name="workday_plan_initial")
+        job_queue.run_daily(
+            self.plan_notifications,
+            time=time(hour=0, minute=5, tzinfo=self.moscow_tz),
+            name="workday_plan"
+        )
 
-            await update.message.reply_text(
-                f"✅ Тестовый режим ВЫКЛЮЧЕН\n"
-                f"Уведомления в {self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d} MSK"
-            )
+    @traced("job.plan_notifications", root=True)
+    async def plan_notifications(self, context: ContextTypes.DEFAULT_TYPE):
+        """Schedule one notification (and its prepare phase) per planned working day.
 
+        Weekends and holidays get no jobs at all; shortened pre-holiday days
+        may use their own notification time.
+        """
+        now = datetime.now(self.moscow_tz)
+        try:
+            plan = await self.planner.plan(now)
+        except Exception as e:
+            # Оставляем ранее запланированные задачи
+            logger.error(f"❌ Failed to plan notifications: {e}", exc_info=True)
+            return
+
+        async with self._mode_lock:
+            # Пока считали план, могли включить тестовый режим
+            if self.test_mode:
+                return
+
+            for job in context.job_queue.jobs():
+                if job.name in ("daily", "daily_prepare"):
+                    job.schedule_removal()
+
+            lead = timedelta(minutes=self.config.NOTIFY_PREPARE_MINUTES)
+            for trigger in plan:
+                context.job_queue.run_once(self.send_notification, when=trigger.at, name="daily", data=trigger)
+                if lead and trigger.at - lead > now:
+                    context.job_queue.run_once(
+                        self.prepare_notification_job,
+                        when=trigger.at - lead,
+                        name="daily_prepare",
+                        data=trigger
+                    )
+
+            self.workday_plan = plan
+
+    async def prepare_notification(self, now: datetime) -> PreparedNotification:
+        """Prepare phase: calendar check, sheet read, render and validation."""
+        with TRACER.span("calendar.check") as span:
+            is_working = await self.calendar_api.is_working_day(now)
+            day_type = await self.calendar_api.get_day_type(now)
+            span.set("working", is_working)
+
+        if not is_working:
+            return PreparedNotification(now, False, day_type, None, [])
+
+        with TRACER.span("sheets.read") as span:
+            duty = await asyncio.to_thread(self.google_client.get_duty, now)
+            span.set("leaders", len(duty.leaders)).set("followers", len(duty.followers))
+
+        with TRACER.span("render"):
+            message = self.google_client.format_duty(duty)
+
+        problems = []
+        if duty.error:
+            problems.append(duty.error)
+        elif not duty.has_duty:
+            problems.append(f"ℹ️ На {now.strftime('%d.%m.%Y')} дежурные не назначены")
+        elif not duty.leaders:
+            problems.append(f"⚠️ На {now.strftime('%d.%m.%Y')} не назначен ведущий")
+
+        link_text = f'<a href="{self.config.SPREADSHEET_URL}">📅 Открыть график дежурств</a>'
+        text = f"{link_text}\n\n{message}"
+
+        return PreparedNotification(now, True, day_type, text, problems, failed=bool(duty.error))
+
+    @traced("job.prepare_notification_job", root=True)
+    async def prepare_notification_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Run the prepare phase ahead of the notification and report problems to admin."""
+        now = datetime.now(self.moscow_tz)
+
+        try:
+            prepared = await self.prepare_notification(now)
+        except Exception as e:
+            logger.error(f"❌ Failed to prepare notification: {e}", exc_info=True)
+            prepared = None
+            problems = [f"❌ Ошибка подготовки: {e}"]
+        else:
+            if prepared.failed:
+                # Ошибку не кэшируем - commit phase повторит чтение графика
+                context.bot_data.pop('prepared_notification', None)
+            else:
+                context.bot_data['prepared_notification'] = prepared
+            problems = prepared.problems
+            logger.info(f"📦 Notification for {now.strftime('%d.%m.%Y')} prepared "
+                        f"(working={prepared.is_working}, problems={len(problems)})")
+
+        if problems:
+            trigger = context.job.data if context.job else None
+            if isinstance(trigger, WorkdayTrigger):
+                notify_at = trigger.at.strftime('%H:%M')
+            else:
+                notify_at = f"{self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d}"
+            problems_text = "\n".join(problems)
             try:
-                await context.bot.send_message(
-                    chat_id=self.config.GROUP_CHAT_ID,
-                    text=f"🟢 <b>Рабочий режим</b>\nУведомления в {self.config.NOTIFY_HOUR:02d}:{self.config.NOTIFY_MINUTE:02d} MSK",
-                    parse_mode="HTML"
+                await self.outbox.send_message(
+                    PRIORITY_ADMIN,
+                    chat_id=self.config.ADMIN_USER_ID,
+                    text=f"⚠️ <b>Проблемы с уведомлением на {notify_at} MSK</b>\n\n{problems_text}",
+                    parse_mode="HTML",
+                    disable_web_page_preview=True
                 )
-            except:
-                pass
+            except Exception as e:
+                logger.error(f"Failed to report prepare problems to admin: {e}")
+
+    def _take_prepared(self, context: ContextTypes.DEFAULT_TYPE, now: datetime) -> Optional[PreparedNotification]:
+        """Return the payload prepared ahead of time, if it is still valid."""
+        prepared = context.bot_data.get('prepared_notification')
+        max_age = max(self.config.NOTIFY_PREPARE_MINUTES * 2, 5) * 60
+
+        if prepared and not prepared.failed and prepared.is_valid_for(now, max_age):
+            return prepared
+        return None
 
+    @traced("job.send_notification", root=True)
     async def send_notification(self, context: ContextTypes.DEFAULT_TYPE):
         """Send duty notification to group with built-in retry logic."""
         try:
             now = datetime.now(self.moscow_tz)
 
-            # Проверяем через API, рабочий ли сегодня день
-            is_working = await self.calendar_api.is_working_day(now)
+            # Commit phase: используем подготовленные данные, иначе готовим на месте
+            prepared = None if self.test_mode else self._take_prepared(context, now)
+            if prepared:
+                logger.info(f"📦 Using notification prepared {prepared.age:.0f}s ago")
+            else:
+                prepared = await self.prepare_notification(now)
 
-            if not is_working:
-                day_type = await self.calendar_api.get_day_type(now)
+            if not prepared.is_working:
+                day_type = prepared.day_type
                 logger.info(f"📅 Сегодня {day_type} ({now.strftime('%d.%m.%Y')}) - пропускаем уведомление")
 
                 # В тестовом режиме отправляем уведомление о пропуске
                 if self.test_mode:
                     link_text = f'<a href="{self.config.SPREADSHEET_URL}">📅 График дежурств</a>'
-                    await context.bot.send_message(
+                    await self.outbox.send_message(
+                        PRIORITY_NOTIFICATION,
                         chat_id=self.config.GROUP_CHAT_ID,
                         text=f"📅 <b>Сегодня {day_type}</b>\n\n"
                              f"Уведомление о дежурстве не отправляется.\n"
@@ -349,13 +777,10 @@ class DutyBotHandlers:
             logger.info(
                 f"🔔 Notification triggered at {now.strftime('%H:%M:%S')} MSK for working day {now.strftime('%d.%m.%Y')}")
 
-            message = self.google_client.get_today_duty()
-            link_text = f'<a href="{self.config.SPREADSHEET_URL}">📅 Открыть график дежурств</a>'
-
             if self.test_mode:
-                full_message = f"⏱️ <b>Тест</b> ({now.strftime('%H:%M:%S')})\n\n{link_text}\n\n{message}"
+                full_message = f"⏱️ <b>Тест</b> ({now.strftime('%H:%M:%S')})\n\n{prepared.text}"
             else:
-                full_message = f"{link_text}\n\n{message}"
+                full_message = prepared.text
 
             # Проверяем rate limit перед отправкой
             last_sent = context.bot_data.get('last_api_call', 0)
@@ -364,9 +789,11 @@ class DutyBotHandlers:
             if current_time - last_sent < 1:
                 await asyncio.sleep(1)
 
-            await self.rate_limiter.wait_if_needed()
+            with TRACER.span("rate_limiter.wait"):
+                await self.rate_limiter.wait_if_needed()
 
-            await context.bot.send_message(
+            await self.outbox.send_message(
+                PRIORITY_NOTIFICATION,
                 chat_id=self.config.GROUP_CHAT_ID,
                 text=full_message,
                 parse_mode="HTML",
@@ -374,6 +801,7 @@ class DutyBotHandlers:
             )
 
             context.bot_data['last_api_call'] = time_module.time()
+            context.bot_data.pop('prepared_notification', None)
             logger.info(f"✅ Notification sent successfully at {now.strftime('%H:%M:%S')} MSK")
 
             context.bot_data['notification_attempts'] = 0
@@ -434,8 +862,9 @@ class DutyBotHandlers:
                 f"(API временно недоступен)"
             )
 
-        await update.message.reply_html(message)
+        await self.reply_html(update, message)
 
+    @traced("job.send_notification_with_rate_limit", root=True)
     async def send_notification_with_rate_limit(self, context: ContextTypes.DEFAULT_TYPE):
         """Send notification with rate limiting - max 1 per minute."""
 
@@ -471,7 +900,7 @@ class DutyBotHandlers:
         """Тестирует API календаря"""
         now = datetime.now(self.moscow_tz)
 
-        await update.message.reply_text("🔄 Тестируем API календаря...")
+        await self.reply_text(update, "🔄 Тестируем API календаря...")
 
         # Проверяем сегодня
         day_info = await self.calendar_api.get_day_info(now)
@@ -491,4 +920,238 @@ class DutyBotHandlers:
         else:
             message += f"⚠️ API вернул некорректные данные: {type(day_info)}"
 
-        await update.message.reply_html(message)
\ No newline at end of file
+        await self.reply_html(update, message)
+
+    async def inline_duty(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Inline query: @bot today | tomorrow | <name>, answered from cached snapshots only."""
+        query = update.inline_query.query.strip()
+        today = datetime.now(self.moscow_tz)
+        results = []
+
+        if query.lower() in ("", "today", "сегодня"):
+            days = [("Сегодня", today)]
+        elif query.lower() in ("tomorrow", "завтра"):
+            days = [("Завтра", today + timedelta(days=1))]
+        else:
+            days = []
+
+        for label, day in days:
+            duty = self.google_client.get_cached_duty(day)
+            if duty is None:
+                continue
+            message = self.google_client.format_duty(duty)
+            names = ", ".join(duty.leaders + duty.followers) or "дежурные не назначены"
+            results.append(InlineQueryResultArticle(
+                id=f"day-{day.strftime('%Y%m%d')}",
+                title=f"{label}, {day.strftime('%d.%m.%Y')}",
+                description=names,
+                input_message_content=InputTextMessageContent(message, parse_mode="HTML"),
+            ))
+
+        if query and not days:
+            # Тот же индекс, что и у /who, чтобы результаты совпадали
+            self.employees.update(list(self.google_client.rosters.values()))
+            for i, (name, _) in enumerate(self.employees.search(query, limit=10)):
+                duties = self.employees.upcoming(name, today.date())
+                if duties:
+                    lines = [f"• {d.strftime('%d.%m.%Y')} — {ROLE_NAMES.get(role, 'ведомый')}"
+                             for d, role in duties]
+                    description = ", ".join(d.strftime('%d.%m') for d, _ in duties)
+                else:
+                    lines = ["• ближайших дежурств нет"]
+                    description = "ближайших дежурств нет"
+                message = f"📋 <b>Дежурства: {name}</b>\n\n" + "\n".join(lines)
+                results.append(InlineQueryResultArticle(
+                    id=f"emp-{i}",
+                    title=name,
+                    description=description,
+                    input_message_content=InputTextMessageContent(message, parse_mode="HTML"),
+                ))
+
+        if results:
+            cache_time = self.config.INLINE_CACHE_TIME
+        else:
+            # Снимок ещё не загружен или ничего не найдено - не кэшируем надолго
+            cache_time = 5
+            results.append(InlineQueryResultArticle(
+                id="empty",
+                title="Нет данных",
+                description="График ещё не загружен или ничего не найдено",
+                input_message_content=InputTextMessageContent("ℹ️ Нет данных о дежурствах"),
+            ))
+
+        await update.inline_query.answer(results, cache_time=cache_time)
+
+    async def cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Duty counts per employee over a period: /stats [месяц|квартал|год|MM.YYYY|YYYY|Q1]."""
+        today = datetime.now(self.moscow_tz).date()
+        period = parse_period(" ".join(context.args or []), today)
+        if period is None:
+            await self.reply_text(update, "Использование: /stats [месяц|квартал|год|ММ.ГГГГ|ГГГГ|Q1..Q4]")
+            return
+
+        title, months = period
+        sheet_names = [self.google_client.get_sheet_name_for_date(month) for month in months]
+
+        # Агрегаты обновляются только для изменившихся снимков
+        self.stats.update(list(self.google_client.rosters.values()))
+
+        # Месяцы без агрегатов читаем одним запросом, параллельные /stats ждут его
+        async with self._stats_lock:
+            metadata = self.google_client.metadata
+            missing = [month for month, name in zip(months, sheet_names)
+                       if name not in self.stats.months and (metadata is None or name in metadata.sheets)]
+            if missing:
+                # Только недостающие листы; их снимки после подсчёта не держим сверх лимита
+                await asyncio.to_thread(self.google_client.get_duty_days, missing)
+                self.stats.update(list(self.google_client.rosters.values()))
+                self.google_client.evict_rosters(self.config.STATS_CACHED_ROSTERS)
+
+        totals = self.stats.totals(sheet_names)
+        if not totals:
+            await self.reply_text(update, f"ℹ️ Нет данных о дежурствах за {title}")
+            return
+
+        rows = sorted(totals.items(), key=lambda item: (-(item[1][0] + item[1][1]), item[0]))
+        lines = [f"• {name} — ведущий: {leader}, ведомый: {follower}"
+                 + (f", отпуск: {vacation}" if vacation else "")
+                 for name, (leader, follower, vacation) in rows if leader or follower or vacation]
+
+        message = f"📊 <b>Дежурства за {title}</b>\n\n" + "\n".join(lines[:40])
+        if len(lines) > 40:
+            message += f"\n… и ещё {len(lines) - 40}"
+
+        absent = [name for name in sheet_names if name not in self.stats.months]
+        if absent and len(absent) < len(sheet_names):
+            message += f"\n\n<i>Нет листов: {', '.join(absent)}</i>"
+
+        await self.reply_html(update, message)
+
+    async def cmd_who(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Next duties of an employee: /who <фамилия>, typos and Latin spelling allowed."""
+        query = " ".join(context.args or []).strip()
+        if not query:
+            await self.reply_text(update, "Использование: /who <фамилия или имя>")
+            return
+
+        rosters = list(self.google_client.rosters.values())
+        if not rosters:
+            await self.reply_text(update, "⏳ График ещё не загружен, попробуйте позже")
+            return
+
+        # Индекс перестраивается только при смене снимков, поиск - без обращений к таблице
+        self.employees.update(rosters)
+        matches = self.employees.resolve(query)
+        if not matches:
+            await self.reply_text(update, "❌ Сотрудник не найден в графике")
+            return
+
+        today = datetime.now(self.moscow_tz).date()
+        blocks = []
+        for name, _ in matches:
+            duties = self.employees.upcoming(name, today, limit=5 if len(matches) == 1 else 3)
+            lines = [f"• {day.strftime('%d.%m.%Y')} ({WEEKDAYS[day.weekday()]}) — {ROLE_NAMES.get(role, 'ведомый')}"
+                     for day, role in duties] or ["• ближайших дежурств нет"]
+            blocks.append(f"📋 <b>{name}</b>\n" + "\n".join(lines))
+
+        header = "" if len(matches) == 1 else "Похожие сотрудники:\n\n"
+        await self.reply_html(update, header + "\n\n".join(blocks))
+
+    async def cmd_subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Link the user to a roster name: /subscribe <ФИО> [вечер|утро]."""
+        user_id = update.effective_user.id
+
+        if update.effective_chat.type != "private":
+            await self.reply_text(update, "✉️ Подписка оформляется в личных сообщениях с ботом")
+            return
+
+        args = list(context.args or [])
+        if not args:
+            sub = self.subscriptions.get(user_id)
+            if sub:
+                when = "вечером накануне" if sub["mode"] == MODE_EVENING else "утром в день дежурства"
+                await self.reply_text(update, f"🔔 Вы подписаны как {sub['name']}, напоминание {when}")
+            else:
+                await self.reply_text(
+                    update,
+                    "Использование: /subscribe <ФИО> [вечер|утро]\n"
+                    "Напоминание придёт вечером накануне (по умолчанию) или утром в день дежурства."
+                )
+            return
+
+        mode = MODE_EVENING
+        if args[-1].lower() in MODE_ALIASES:
+            mode = MODE_ALIASES[args.pop().lower()]
+
+        names = {name for roster in list(self.google_client.rosters.values()) for name in roster.names}
+        if not names:
+            await self.reply_text(update, "⏳ График ещё не загружен, попробуйте позже")
+            return
+
+        name, candidates = resolve_name(" ".join(args), names)
+        if name is None:
+            if candidates:
+                await self.reply_text(update, "Уточните имя, подходят:\n" + "\n".join(candidates[:10]))
+            else:
+                await self.reply_text(update, "❌ Сотрудник не найден в графике")
+            return
+
+        self.subscriptions.subscribe(user_id, name, mode)
+        when = "вечером накануне" if mode == MODE_EVENING else "утром в день дежурства"
+        logger.info(f"User {user_id} subscribed as '{name}' ({mode})")
+        await self.reply_text(update, f"✅ Подписка оформлена: {name}, напоминание {when}")
+
+    async def cmd_unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Remove the user's duty subscription."""
+        if self.subscriptions.unsubscribe(update.effective_user.id):
+            await self.reply_text(update, "🔕 Подписка отменена")
+        else:
+            await self.reply_text(update, "Вы не подписаны")
+
+    @traced("job.send_subscription_digest", root=True)
+    async def _send_reminder(self, user_id: int, name: str, text: str) -> bool:
+        try:
+            await self.outbox.send_message(PRIORITY_NOTIFICATION, chat_id=user_id, text=text, parse_mode="HTML")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to send reminder to {user_id} ({name}): {e}")
+            return False
+
+    async def send_subscription_digest(self, context: ContextTypes.DEFAULT_TYPE):
+        """Fan out personal duty reminders for tomorrow (evening) or today (morning)."""
+        mode = context.job.data
+        subscribers = self.subscriptions.by_mode(mode)
+        if not subscribers:
+            return
+
+        day = datetime.now(self.moscow_tz)
+        if mode == MODE_EVENING:
+            day += timedelta(days=1)
+
+        if not await self.calendar_api.is_working_day(day):
+            return
+
+        if self.duty_index.update(list(self.google_client.rosters.values())):
+            logger.debug("Duty index rebuilt for %d employees", len(self.duty_index.by_name))
+
+        # Один проход по подписчикам с O(1) поиском в индексе
+        recipients = []
+        for user_id, name in subscribers:
+            role = self.duty_index.role(name, day.date())
+            if role in (ROLE_LEADER, ROLE_FOLLOWER):
+                recipients.append((user_id, name, role))
+
+        when = "Завтра" if mode == MODE_EVENING else "Сегодня"
+        text = f"🔔 {when} ({day.strftime('%d.%m.%Y')}) вы дежурите: <b>{{role}}</b>"
+        sent = 0
+        for i in range(0, len(recipients), SUBSCRIPTION_BATCH_SIZE):
+            if i:
+                await asyncio.sleep(1)
+            # Пачка уходит в очередь разом и разбирается всеми воркерами
+            results = await asyncio.gather(*(
+                self._send_reminder(user_id, name, text.format(role=ROLE_NAMES.get(role, 'ведомый')))
+                for user_id, name, role in recipients[i:i + SUBSCRIPTION_BATCH_SIZE]
+            ))
+            sent += sum(results)
+
+        logger.info(f"🔔 Sent {sent}/{len(recipients)} {mode} reminders for {day.strftime('%d.%m.%Y')}")
@@ -0,0 +1,208 @@
+"""
+In-process HTTP health and readiness endpoint, plus ICS/CSV duty feeds.
+
+Answers from in-memory state only and never calls external APIs.
+"""
+import hmac
+import logging
+import time as time_module
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+import feeds
+from metrics import METRICS
+from transport import transports_state
+
+logger = logging.getLogger(__name__)
+
+
+class HealthServer:
+    """Lightweight aiohttp server exposing /healthz, /readyz, /status, /metrics and /feeds."""
+
+    def __init__(self, application, handlers, watchdog, host: str, port: int,
+                 stall_seconds: float = 5.0, snapshot_max_age: float = 86400.0):
+        self.application = application
+        self.handlers = handlers
+        self.watchdog = watchdog
+        self.host = host
+        self.port = port
+        self.stall_seconds = stall_seconds
+        self.snapshot_max_age = snapshot_max_age
+        self.started_at = time_module.time()
+        self.app = web.Application()
+        self.app.router.add_get("/healthz", self.handle_health)
+        self.app.router.add_get("/readyz", self.handle_ready)
+        self.app.router.add_get("/status", self.handle_status)
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        self.app.router.add_get("/feeds/team.{fmt:ics|csv}", self.handle_feed)
+        self.app.router.add_get("/feeds/employee/{name}.{fmt:ics|csv}", self.handle_feed)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🩺 Health endpoint listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def loop_state(self) -> Dict[str, Any]:
+        beat_age = self.watchdog.heartbeat_age
+        alive = beat_age is None or beat_age < self.stall_seconds
+        return {
+            "alive": alive,
+            "heartbeat_age": beat_age,
+            "lag": self.watchdog.lag,
+            "max_lag": self.watchdog.max_lag,
+            "stalls": self.watchdog.stalls,
+        }
+
+    def jobs_state(self) -> Dict[str, Any]:
+        job_queue = self.application.job_queue
+        if job_queue is None:
+            return {}
+        jobs = {}
+        for job in job_queue.jobs():
+            # Задачи с одним именем (по рабочим дням) - показываем ближайшую
+            jobs.setdefault(job.name, job.next_t.isoformat() if job.next_t else None)
+        return jobs
+
+    def schedule_state(self) -> list:
+        return [
+            {"at": trigger.at.isoformat(), "shortened": trigger.shortened, "day_type": trigger.day_type}
+            for trigger in self.handlers.workday_plan
+        ]
+
+    def snapshots_state(self) -> Dict[str, Any]:
+        google_client = self.handlers.google_client
+        metadata = google_client.metadata
+        return {
+            "rosters": {
+                name: {"age": roster.age, "revision": roster.revision, "employees": len(roster.names),
+                       "bytes": roster.nbytes()}
+                for name, roster in list(google_client.rosters.items())
+            },
+            "rosters_bytes": sum(roster.nbytes() for roster in list(google_client.rosters.values())),
+            "metadata_revision": metadata.revision if metadata else None,
+            "metadata_checked_age": time_module.time() - metadata.checked_at if metadata else None,
+            "refresh": self.handlers.snapshots.state(datetime.now(self.handlers.moscow_tz)),
+        }
+
+    def circuits_state(self) -> Dict[str, Any]:
+        return {
+            "google_sheets": self.handlers.google_client.circuit.snapshot(),
+            "production_calendar": self.handlers.calendar_api.circuit.snapshot(),
+        }
+
+    def is_ready(self) -> bool:
+        if not self.loop_state()["alive"]:
+            return False
+        if self.application.job_queue is None or not self.application.job_queue.jobs():
+            return False
+        rosters = self.handlers.google_client.rosters
+        # Пока нет ни одного снимка, готовность определяется только планировщиком
+        if rosters and min(roster.age for roster in list(rosters.values())) > self.snapshot_max_age:
+            return False
+        return True
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        loop = self.loop_state()
+        return web.json_response(loop, status=200 if loop["alive"] else 503)
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        ready = self.is_ready()
+        return web.json_response({"ready": ready}, status=200 if ready else 503)
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "uptime": time_module.time() - self.started_at,
+            "test_mode": self.handlers.test_mode,
+            "loop": self.loop_state(),
+            "jobs": self.jobs_state(),
+            "schedule": self.schedule_state(),
+            "snapshots": self.snapshots_state(),
+            "circuits": self.circuits_state(),
+            "transports": transports_state(),
+        })
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=METRICS.render(), content_type="text/plain")
+
+    def _feed_not_modified(self, request: web.Request, etag: str, last_modified: datetime) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match главнее If-Modified-Since (RFC 9110, 13.2.2)
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return etag in tags or "*" in tags
+        if_modified_since = request.if_modified_since
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+    async def handle_feed(self, request: web.Request) -> web.StreamResponse:
+        """Team or per-employee duty feed streamed from the roster snapshots."""
+        token = self.handlers.config.FEED_TOKEN
+        if not token:
+            # Без токена ленты выключены: порт health-сервера часто открыт наружу
+            raise web.HTTPNotFound(text="Feeds are disabled: set FEED_TOKEN")
+        if not hmac.compare_digest(request.query.get("token", ""), token):
+            raise web.HTTPForbidden()
+
+        fmt = request.match_info["fmt"]
+        google_client = self.handlers.google_client
+        rosters = feeds.ordered(list(google_client.rosters.values()))
+        if not rosters:
+            raise web.HTTPServiceUnavailable(text="Roster is not loaded yet", headers={"Retry-After": "60"})
+
+        query = request.match_info.get("name")
+        if query is None:
+            subject = "team"
+            days = feeds.team_days(rosters)
+            calendar_name = "Дежурства"
+        else:
+            # Точное имя или однозначное совпадение (латиница, опечатки)
+            self.handlers.employees.update(rosters)
+            matches = self.handlers.employees.resolve(query)
+            if len(matches) != 1:
+                raise web.HTTPNotFound(text="Employee not found" if not matches else "Ambiguous employee name")
+            subject = matches[0][0]
+            days = feeds.employee_days(rosters, subject)
+            calendar_name = f"Дежурства: {subject}"
+
+        metadata = google_client.metadata
+        etag = feeds.feed_etag(rosters, fmt, subject)
+        last_modified = feeds.feed_last_modified(
+            rosters,
+            metadata.revision if metadata else None,
+            metadata.modified_time if metadata else None
+        )
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if self._feed_not_modified(request, etag, last_modified):
+            METRICS.inc("feed_requests_total", labels={"format": fmt, "status": "304"},
+                        help="Duty feed requests")
+            response = web.Response(status=304, headers=headers)
+            response.last_modified = last_modified
+            return response
+
+        METRICS.inc("feed_requests_total", labels={"format": fmt, "status": "200"},
+                    help="Duty feed requests")
+        response = web.StreamResponse(headers=headers)
+        response.content_type = feeds.CONTENT_TYPES[fmt]
+        response.charset = "utf-8"
+        response.last_modified = last_modified
+        response.enable_compression()
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+
+        if fmt == feeds.FORMAT_ICS:
+            lines = feeds.ics_lines(days, calendar_name, subject, last_modified, team=query is None)
+        else:
+            lines = feeds.csv_lines(days)
+        for chunk in feeds.chunks(lines):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
@@ -5,11 +5,16 @@ Uses free API from production-calendar.ru
 import aiohttp
 import asyncio
 import json
+import time as time_module
 from datetime import datetime, timedelta
 import logging
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Tuple, Union
 import pytz
 
+from cassette import Cassette
+from circuit import CircuitBreaker
+from tracing import TRACER
+
 logger = logging.getLogger(__name__)
 
 # Московский часовой пояс
@@ -25,11 +30,48 @@ API_BASE_URL = "https://www.production-calendar.ru/get-period"
 class ProductionCalendarAPI:
     """Клиент для API производственного календаря РФ"""
 
-    def __init__(self, token: str = GUEST_TOKEN, country: str = "ru"):
+    def __init__(self, token: str = GUEST_TOKEN, country: str = "ru", cassette: Optional[Cassette] = None):
         self.token = token
         self.country = country
         self.cache = {}  # Простое кэширование
         self.cache_ttl = 3600  # 1 час
+        self.circuit = CircuitBreaker("production_calendar")
+        self.cassette = None
+        if cassette:
+            self.use_cassette(cassette)
+
+    def use_cassette(self, cassette: Cassette):
+        """Record API traffic to, or replay it from, a cassette."""
+        cassette.redact(self.token)
+        self.cassette = cassette
+
+    async def _fetch(self, url: str, timeout: float) -> Tuple[int, Any, str]:
+        """
+        GET запрос к API
+
+        Returns:
+            (HTTP статус, разобранный JSON или None, текст ответа)
+        """
+        with TRACER.span("calendar.fetch", url=url.replace(self.token, "<token>")) as span:
+            if self.cassette and self.cassette.replaying:
+                entry = await self.cassette.replay_async("calendar", "GET", url)
+                status, text = entry["status"], entry["body"]
+            else:
+                started = time_module.monotonic()
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url, timeout=timeout) as response:
+                        status = response.status
+                        text = await response.text()
+                if self.cassette:
+                    self.cassette.record("calendar", "GET", url, None, status, text,
+                                         time_module.monotonic() - started)
+            span.set("status", status).set("bytes", len(text))
+
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        return status, data, text
 
     async def get_day_info(self, date: datetime) -> Optional[Dict[str, Any]]:
         """
@@ -51,6 +93,10 @@ class ProductionCalendarAPI:
                 logger.debug(f"Cache hit for {date_str}")
                 return cache_data
 
+        # API недавно не отвечал - сразу используем запасную логику
+        if not self.circuit.allow():
+            return None
+
         # Формируем URL запроса
         period = date.strftime("%d.%m.%Y")
         url = f"{API_BASE_URL}/{self.token}/{self.country}/{period}/json"
@@ -58,43 +104,43 @@ class ProductionCalendarAPI:
         logger.info(f"Fetching day info from API: {url}")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as response:
-                    if response.status == 200:
-                        # API может вернуть JSON или строку
-                        try:
-                            data = await response.json()
-                        except:
-                            # Если не JSON, пробуем прочитать как текст
-                            text = await response.text()
-                            logger.warning(f"API returned non-JSON response: {text[:100]}")
-                            return None
-
-                        # Проверяем структуру ответа
-                        if isinstance(data, dict):
-                            if data.get("status") == "ok" and "days" in data and len(data["days"]) > 0:
-                                day_data = data["days"][0]
-                                self.cache[cache_key] = (datetime.now(), day_data)
-                                return day_data
-                            elif "type_id" in data:
-                                # Прямой ответ для одного дня
-                                self.cache[cache_key] = (datetime.now(), data)
-                                return data
-                            else:
-                                logger.error(f"API returned unexpected structure: {data}")
-                                return None
-                        else:
-                            logger.error(f"API returned non-dict: {type(data)}")
-                            return None
+            status, data, text = await self._fetch(url, timeout=10)
+            if status == 200:
+                # API может вернуть JSON или строку
+                if data is None:
+                    logger.warning(f"API returned non-JSON response: {text[:100]}")
+                    return None
+
+                # Проверяем структуру ответа
+                if isinstance(data, dict):
+                    if data.get("status") == "ok" and "days" in data and len(data["days"]) > 0:
+                        day_data = data["days"][0]
+                        self.cache[cache_key] = (datetime.now(), day_data)
+                        self.circuit.record_success()
+                        return day_data
+                    elif "type_id" in data:
+                        # Прямой ответ для одного дня
+                        self.cache[cache_key] = (datetime.now(), data)
+                        self.circuit.record_success()
+                        return data
                     else:
-                        logger.error(f"API request failed with status {response.status}")
+                        logger.error(f"API returned unexpected structure: {data}")
                         return None
+                else:
+                    logger.error(f"API returned non-dict: {type(data)}")
+                    return None
+            else:
+                logger.error(f"API request failed with status {status}")
+                self.circuit.record_failure(f"HTTP {status}")
+                return None
 
         except asyncio.TimeoutError:
             logger.error("API request timeout")
+            self.circuit.record_failure("timeout")
             return None
         except Exception as e:
             logger.error(f"API request error: {e}")
+            self.circuit.record_failure(e)
             return None
 
     async def is_working_day(self, date: datetime) -> bool:
@@ -157,22 +203,19 @@ class ProductionCalendarAPI:
         logger.info(f"Prefetching month {month}.{year}")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=15) as response:
-                    if response.status == 200:
-                        try:
-                            data = await response.json()
-                        except:
-                            logger.warning(f"Prefetch returned non-JSON response")
-                            return
-
-                        if isinstance(data, dict) and data.get("status") == "ok" and "days" in data:
-                            # Кэшируем каждый день
-                            for day_data in data["days"]:
-                                date_str = day_data.get("date")
-                                if date_str:
-                                    self.cache[date_str] = (datetime.now(), day_data)
-
-                            logger.info(f"Prefetched {len(data['days'])} days for {month}.{year}")
+            status, data, _ = await self._fetch(url, timeout=15)
+            if status == 200:
+                if data is None:
+                    logger.warning(f"Prefetch returned non-JSON response")
+                    return
+
+                if isinstance(data, dict) and data.get("status") == "ok" and "days" in data:
+                    # Кэшируем каждый день
+                    for day_data in data["days"]:
+                        date_str = day_data.get("date")
+                        if date_str:
+                            self.cache[date_str] = (datetime.now(), day_data)
+
+                    logger.info(f"Prefetched {len(data['days'])} days for {month}.{year}")
         except Exception as e:
             logger.error(f"Failed to prefetch month: {e}")
\ No newline at end of file
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Load test harness: drives synthetic updates through the real Application
+and DutyBotHandlers against local fake Bot API and Google Sheets backends.
+
+Usage:
+    python src/loadtest.py --updates 5000 --concurrency 50 --mix duty=6,status=3,calendar=1
+    python src/loadtest.py --chats 50 --hot-share 0.5
+    python src/loadtest.py --cassette data/cassette.jsonl --latency-scale 3
+"""
+import argparse
+import asyncio
+import calendar
+import json
+import logging
+import random
+import statistics
+import tempfile
+import time as time_module
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytz
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+from bot import register_handlers
+from cassette import Cassette, MODE_REPLAY
+from config import Config
+from google_sheets import GoogleSheetsClient
+from handlers import DutyBotHandlers
+from holiday_api import ProductionCalendarAPI
+from update_processor import PerChatUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MSK_TZ = pytz.timezone('Europe/Moscow')
+BOT_ID = 100000
+ADMIN_ID = 1
+GROUP_ID = -1000000000001
+
+COMMANDS = ("duty", "status", "calendar", "time", "test", "chatid", "stats", "who")
+# Arguments sent with a command (a misspelt Latin name for /who)
+COMMAND_ARGS = {"who": "sotrudnik 0007"}
+
+
+class FakeBotRequest(BaseRequest):
+    """Bot API stand-in: answers every method locally and counts calls."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "Duty", "username": "duty_bot",
+                    "can_join_groups": True, "can_read_all_group_messages": False,
+                    "supports_inline_queries": True}
+        if api_method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time_module.time()),
+                    "chat": {"id": int(params.get("chat_id", GROUP_ID)), "type": "group"},
+                    "text": params.get("text", "")}
+        if api_method == "getChatMember":
+            return {"status": "member", "user": {"id": BOT_ID, "is_bot": True, "first_name": "Duty"}}
+        return True
+
+
+class FakeHTTPResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeSpreadsheet:
+    """Spreadsheet stand-in serving generated month grids with blocking latency."""
+
+    id = "loadtest"
+
+    def __init__(self, employees: int, latency: float, stats: Counter):
+        self.latency = latency
+        self.stats = stats
+        self.client = self
+        self.sheets = {}
+
+        months_ru = GoogleSheetsClient('', '', MSK_TZ).months_ru
+        today = datetime.now(MSK_TZ).date().replace(day=1)
+        for month_start in (today, (today + timedelta(days=32)).replace(day=1)):
+            title = f"{months_ru[month_start.month]} {month_start.year}"
+            self.sheets[title] = self._month_grid(month_start, employees)
+
+    @staticmethod
+    def _month_grid(month_start, employees: int):
+        days = calendar.monthrange(month_start.year, month_start.month)[1]
+        green = {"effectiveFormat": {"backgroundColor": {"green": 0.8}}}
+        red = {"effectiveFormat": {"backgroundColor": {"red": 0.9, "green": 0.4}}}
+
+        rows = [[{"formattedValue": "ФИО"}] +
+                [{"formattedValue": f"{d:02d}.{month_start.month:02d}"} for d in range(1, days + 1)]]
+        for e in range(employees):
+            row = [{"formattedValue": f"Сотрудник {e:04d}"}]
+            for d in range(1, days + 1):
+                slot = (d + e) % max(employees // 2, 3)
+                row.append(green if slot == 0 else red if slot == 1 else {})
+            rows.append(row)
+        return rows
+
+    def request(self, method, url, params=None, **kwargs):
+        self.stats["drive"] += 1
+        return FakeHTTPResponse({"version": "1", "modifiedTime": "2026-01-01T00:00:00Z"})
+
+    def fetch_sheet_metadata(self, params=None):
+        self.stats["sheets"] += 1
+        if self.latency:
+            time_module.sleep(self.latency)
+
+        if "ranges" not in params:
+            return {"sheets": [{"properties": {"title": title, "sheetId": i}}
+                               for i, title in enumerate(self.sheets)]}
+
+        sheets = {}
+        for a1 in params["ranges"]:
+            title, _, cells = a1.partition("!")
+            title = title.strip("'")
+            rows = self._slice(self.sheets[title], cells)
+            sheets.setdefault(title, []).append({"rowData": [{"values": row} for row in rows]})
+        return {"sheets": [{"properties": {"title": title}, "data": data} for title, data in sheets.items()]}
+
+    @staticmethod
+    def _slice(grid, cells: str):
+        """Rows of a whole-sheet, whole-row ("1:1") or whole-column ("F:F") range."""
+        if not cells:
+            return grid
+        first = cells.split(":")[0]
+        if first.isdigit():
+            return [grid[int(first) - 1]]
+        col = 0
+        for letter in first:
+            col = col * 26 + ord(letter) - 64
+        return [[row[col - 1]] if col - 1 < len(row) else [] for row in grid]
+
+
+class FakeGspreadClient:
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+class FakeCalendarAPI(ProductionCalendarAPI):
+    """Production calendar stand-in: every weekday is a working day."""
+
+    def __init__(self, latency: float, stats: Counter):
+        super().__init__()
+        self.latency = latency
+        self.stats = stats
+
+    async def get_day_info(self, date):
+        self.stats["calendar"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        working = date.weekday() < 5
+        return {"type_id": 1 if working else 2, "type_text": "Рабочий день" if working else "Выходной день"}
+
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes up a periodic sleeper."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - expected, 0.0))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def make_update(update_id: int, command: str, user_id: int, chat_id: int, bot) -> Update:
+    command_text = f"/{command}"
+    text = f"{command_text} {COMMAND_ARGS[command]}" if command in COMMAND_ARGS else command_text
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time_module.time()),
+            "chat": {"id": chat_id, "type": "group", "title": f"Load test {chat_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command_text)}],
+        },
+    }, bot)
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"Unknown command in mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def run(args) -> dict:
+    stats = Counter()
+    bot_request = FakeBotRequest(latency=args.bot_latency)
+
+    config = type("LoadTestConfig", (Config,), {
+        "GROUP_CHAT_ID": GROUP_ID,
+        "ADMIN_USER_ID": ADMIN_ID,
+        "SPREADSHEET_URL": "https://example.invalid/sheet",
+        "SUBSCRIPTIONS_FILE": str(Path(tempfile.mkdtemp()) / "subscriptions.json"),
+    })
+
+    if args.cassette:
+        # Реальные ответы и задержки из записанной кассеты
+        cassette = Cassette(args.cassette, MODE_REPLAY, args.latency_scale)
+        cassette.load()
+        google_client = GoogleSheetsClient("", "loadtest", MSK_TZ, cassette=cassette)
+        handlers = DutyBotHandlers(config, google_client, test_mode=False)
+        handlers.calendar_api.use_cassette(cassette)
+    else:
+        cassette = None
+        google_client = GoogleSheetsClient("", "loadtest", MSK_TZ)
+        google_client.client = FakeGspreadClient(FakeSpreadsheet(args.employees, args.sheets_latency, stats))
+        handlers = DutyBotHandlers(config, google_client, test_mode=False)
+        handlers.calendar_api = FakeCalendarAPI(args.calendar_latency, stats)
+
+    # Как в bot.main(): параллельная обработка с порядком внутри чата
+    app = Application.builder() \
+        .token(f"{BOT_ID}:loadtest") \
+        .request(bot_request) \
+        .get_updates_request(FakeBotRequest()) \
+        .concurrent_updates(PerChatUpdateProcessor(max(args.concurrency, 1))) \
+        .build()
+    register_handlers(app, handlers)
+
+    commands, weights = zip(*parse_mix(args.mix).items())
+    rng = random.Random(args.seed)
+    # Горячий чат (группа дежурных) получает hot_share апдейтов, остальные делят остаток
+    chat_ids = [GROUP_ID - i for i in range(max(args.chats, 1))]
+    updates = [
+        make_update(
+            i,
+            rng.choices(commands, weights)[0],
+            rng.randint(1, args.users),
+            GROUP_ID if len(chat_ids) == 1 or rng.random() < args.hot_share else rng.choice(chat_ids[1:]),
+            app.bot
+        )
+        for i in range(1, args.updates + 1)
+    ]
+
+    enqueued_at = {}
+    latencies = []
+    completed = {}
+    done = asyncio.Event()
+
+    async def on_processed(update: Update, context):
+        latencies.append(time_module.perf_counter() - enqueued_at[update.update_id])
+        completed.setdefault(update.effective_chat.id, []).append(update.update_id)
+        if len(latencies) == len(updates):
+            done.set()
+
+    # Отдельная группа выполняется после обработчика команды того же апдейта
+    app.add_handler(TypeHandler(Update, on_processed), group=1)
+
+    await app.initialize()
+    await handlers.outbox.start(app.bot)
+    await app.start()
+
+    sampler = LoopLagSampler()
+    sampler.start()
+    bot_request.calls.clear()
+
+    # Апдейты идут через update_queue, как из getUpdates
+    started = time_module.perf_counter()
+    for update in updates:
+        enqueued_at[update.update_id] = time_module.perf_counter()
+        app.update_queue.put_nowait(update)
+    await done.wait()
+    elapsed = time_module.perf_counter() - started
+
+    sampler.stop()
+    await app.stop()
+    await handlers.outbox.stop()
+    await app.shutdown()
+
+    # Апдейты одного чата должны завершаться в порядке update_id
+    order_violations = sum(
+        1 for ids in completed.values() for prev, cur in zip(ids, ids[1:]) if cur < prev
+    )
+
+    return {
+        "updates": len(updates),
+        "concurrency": args.concurrency,
+        "chats": len(completed),
+        "hot_chat_updates": len(completed.get(GROUP_ID, [])),
+        "order_violations": order_violations,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(len(updates) / elapsed, 1) if elapsed else None,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "latency_max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        "loop_lag_p99_ms": round(percentile(sampler.samples, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(sampler.samples, default=0.0) * 1000, 2),
+        "loop_lag_mean_ms": round(statistics.fmean(sampler.samples) * 1000, 2) if sampler.samples else 0.0,
+        "bot_api_calls": dict(bot_request.calls),
+        "backend_calls": dict(stats),
+        "cassette": {"hits": cassette.hits, "inexact": cassette.misses} if cassette else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive synthetic updates through the duty bot")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200, help="Distinct user IDs (user 1 is admin)")
+    parser.add_argument("--chats", type=int, default=20, help="Distinct group chats (the first one is hot)")
+    parser.add_argument("--hot-share", type=float, default=0.3, help="Share of updates sent to the hot chat")
+    parser.add_argument("--mix", default="duty=6,status=3,calendar=1",
+                        help=f"Weighted command mix, commands: {', '.join(COMMANDS)}")
+    parser.add_argument("--employees", type=int, default=40, help="Employees per month sheet")
+    parser.add_argument("--bot-latency", type=float, default=0.02, help="Fake Bot API latency, s")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="Fake Sheets latency (blocking), s")
+    parser.add_argument("--calendar-latency", type=float, default=0.05, help="Fake calendar API latency, s")
+    parser.add_argument("--cassette", help="Replay recorded Sheets/calendar traffic instead of the fakes")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded latencies")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Minimal in-process metrics registry rendered in Prometheus text format.
+"""
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels_key(labels: Dict[str, str]) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class Metrics:
+    """Gauges, counters and callback gauges evaluated at scrape time."""
+
+    def __init__(self):
+        self.gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self.counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self.callbacks: Dict[str, Callable[[], Dict[LabelsKey, float]]] = {}
+        self.help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def set_gauge(self, name: str, value: float, labels: Dict[str, str] = None, help: str = ""):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels_key(labels)] = float(value)
+            if help:
+                self.help.setdefault(name, help)
+
+    def inc(self, name: str, value: float = 1.0, labels: Dict[str, str] = None, help: str = ""):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0.0) + value
+            if help:
+                self.help.setdefault(name, help)
+
+    def register_callback(self, name: str,
+                          callback: Callable[[], Iterable[Tuple[Optional[Dict[str, str]], float]]],
+                          help: str = ""):
+        """Gauge computed on each scrape; callback yields (labels or None, value) pairs."""
+        def collect():
+            return {_labels_key(labels): value for labels, value in callback()}
+        self.callbacks[name] = collect
+        if help:
+            self.help[name] = help
+
+    def render(self) -> str:
+        lines = []
+
+        def emit(name, kind, series):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in series.items():
+                labels = ",".join(f'{k}="{v}"' for k, v in key)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+
+        for name, series in gauges.items():
+            emit(name, "gauge", series)
+        for name, series in counters.items():
+            emit(name, "counter", series)
+        for name, collect in list(self.callbacks.items()):
+            try:
+                emit(name, "gauge", collect())
+            except Exception:
+                continue
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
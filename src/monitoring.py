@@ -0,0 +1,109 @@
+"""
+Event-loop lag monitoring.
+
+A heartbeat coroutine measures how late the loop wakes it up, and a
+watchdog thread samples the loop thread's stack when the heartbeat stalls,
+so blocking calls inside handlers and jobs show up in the logs.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time as time_module
+import traceback
+from typing import Optional
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """Continuous scheduler-lag measurement with stack sampling of stalls."""
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.5):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_beat: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start monitoring the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.last_beat = time_module.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"⏱️ Event-loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    @property
+    def heartbeat_age(self) -> Optional[float]:
+        if self.last_beat is None:
+            return None
+        return time_module.monotonic() - self.last_beat
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(loop.time() - expected, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.last_beat = time_module.monotonic()
+
+            METRICS.set_gauge("event_loop_lag_seconds", self.lag,
+                              help="Delay of the last event-loop heartbeat")
+            METRICS.set_gauge("event_loop_lag_max_seconds", self.max_lag,
+                              help="Largest event-loop heartbeat delay since start")
+
+            if self.lag >= self.threshold:
+                logger.warning(f"🐢 Event loop was blocked for {self.lag * 1000:.0f} ms")
+
+    def _watch(self):
+        """Watchdog thread: sample the loop thread's stack while it is blocked."""
+        sampled_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            age = self.heartbeat_age
+            if age is None or age < self.interval + self.threshold:
+                continue
+
+            # Одна выборка стека на эпизод блокировки
+            if sampled_beat == self.last_beat:
+                continue
+            sampled_beat = self.last_beat
+
+            self.stalls += 1
+            METRICS.inc("event_loop_stalls_total", help="Event-loop stalls longer than the threshold")
+            logger.warning(
+                f"🐢 Event loop blocked for {age * 1000:.0f}+ ms in {self._current_task_name()}\n"
+                f"{self._loop_stack()}"
+            )
+
+    def _current_task_name(self) -> str:
+        # Пока цикл заблокирован, спросить его изнутри нельзя: задачу отдаёт
+        # публичный current_task с явным циклом (только для диагностики)
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return "loop callback"
+        coro = task.get_coro()
+        return f"task '{task.get_name()}' ({getattr(coro, '__qualname__', coro)})"
+
+    def _loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return "<no stack>"
+        return "".join(traceback.format_stack(frame, limit=15))
@@ -0,0 +1,158 @@
+"""
+Prioritized outbound message queue with dedicated sender workers.
+"""
+import asyncio
+import itertools
+import logging
+from typing import Any, Optional
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import METRICS
+from tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+# Lower value is sent first
+PRIORITY_NOTIFICATION = 0
+PRIORITY_ADMIN = 1
+PRIORITY_USER = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_NOTIFICATION: "notification",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_USER: "user",
+}
+
+MAX_SEND_ATTEMPTS = 3
+
+# Errors a retry cannot fix (bad markup, blocked bot, wrong chat); BadRequest is a NetworkError subclass
+PERMANENT_ERRORS = (BadRequest, Forbidden, ChatMigrated)
+
+
+class OutboxFull(Exception):
+    """Raised when a low-priority message is shed because the queue is full."""
+
+
+class OutboundQueue:
+    """All outbound Bot API calls go through a priority queue drained by workers.
+
+    Higher priorities wait for queue space (backpressure); user replies are
+    shed when the queue is full. A RetryAfter from Telegram pauses all
+    workers for the requested time and the message is retried.
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 500):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.bot = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self, bot):
+        self.bot = bot
+        self._queue = asyncio.PriorityQueue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"outbox-worker-{i}")
+            for i in range(self.workers)
+        ]
+        METRICS.register_callback("outbox_queue_size", lambda: [(None, self.qsize())],
+                                  help="Messages waiting in the outbound queue")
+        logger.info(f"📤 Outbound queue started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def call(self, priority: int, method: str, **kwargs) -> Any:
+        """Queue a Bot API call and wait for its result."""
+        with TRACER.span(f"telegram.{method}", priority=PRIORITY_NAMES.get(priority, priority),
+                         text_length=len(kwargs.get("text") or "")):
+            return await self._call(priority, method, **kwargs)
+
+    async def _call(self, priority: int, method: str, **kwargs) -> Any:
+        if self.bot is None:
+            raise RuntimeError("Outbound queue is not started")
+
+        if not self.running:
+            # Без воркеров (OUTBOX_WORKERS=0) отправляем напрямую
+            return await getattr(self.bot, method)(**kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        item = (priority, next(self._seq), method, kwargs, future, 1)
+
+        if priority >= PRIORITY_USER:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                METRICS.inc("outbox_shed_total", help="User replies dropped because the queue was full")
+                raise OutboxFull("Outbound queue is full")
+        else:
+            await self._queue.put(item)
+
+        return await future
+
+    async def send_message(self, priority: int, chat_id, text: str, **kwargs) -> Any:
+        return await self.call(priority, "send_message", chat_id=chat_id, text=text, **kwargs)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, seq, method, kwargs, future, attempt = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+
+                pause = self._paused_until - loop.time()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+                try:
+                    result = await getattr(self.bot, method)(**kwargs)
+                except RetryAfter as e:
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") \
+                        else float(e.retry_after)
+                    self._paused_until = max(self._paused_until, loop.time() + retry_after)
+                    logger.warning(f"⏳ Flood control: pausing outbound queue for {retry_after:.0f}s")
+                    self._retry(priority, seq, method, kwargs, future, attempt, e)
+                except PERMANENT_ERRORS as e:
+                    METRICS.inc("outbox_failed_total", labels={"error": type(e).__name__},
+                                help="Messages rejected by Telegram without retry")
+                    if not future.done():
+                        future.set_exception(e)
+                except (TimedOut, NetworkError) as e:
+                    # Повтор ставится в очередь с задержкой, воркер не простаивает
+                    loop.call_later(attempt, self._retry, priority, seq, method, kwargs, future, attempt, e)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    METRICS.inc("outbox_sent_total", labels={"priority": PRIORITY_NAMES.get(priority, priority)},
+                                help="Messages sent through the outbound queue")
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    def _retry(self, priority, seq, method, kwargs, future, attempt, error):
+        if attempt >= MAX_SEND_ATTEMPTS or future.done() or not self.running:
+            if not future.done():
+                future.set_exception(error)
+            return
+        # Сохраняем исходный seq, чтобы не потерять место в очереди
+        item = (priority, seq, method, kwargs, future, attempt + 1)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            future.set_exception(error)
@@ -0,0 +1,118 @@
+"""
+Compact in-memory roster model.
+"""
+import sys
+import time as time_module
+from array import array
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
+
+# Duty roles of a roster cell (stored as uint8)
+ROLE_NONE = 0
+ROLE_LEADER = 1
+ROLE_FOLLOWER = 2
+ROLE_VACATION = 3
+
+
+class MonthRoster:
+    """Roster of one month sheet: interned names and an employees x days role matrix.
+
+    Roles are kept in a flat ``array('B')`` in employee-major order, so an
+    employee's month is a contiguous slice and a day is a strided slice.
+    """
+
+    __slots__ = ('sheet_name', 'revision', 'fetched_at', 'validated_at', 'names', 'dates',
+                 '_roles', '_name_index', '_date_index')
+
+    def __init__(self, sheet_name: str, names: List[str], dates: List[date],
+                 roles: array, revision: Optional[int] = None):
+        if len(roles) != len(names) * len(dates):
+            raise ValueError("Roles matrix does not match roster dimensions")
+
+        self.sheet_name = sheet_name
+        self.revision = revision
+        self.fetched_at = time_module.time()
+        # Когда ревизия таблицы последний раз совпала со снимком (свежесть данных)
+        self.validated_at = self.fetched_at
+        self.names = tuple(sys.intern(name) for name in names)
+        self.dates = tuple(dates)
+        self._roles = roles
+        self._name_index = {name: i for i, name in enumerate(self.names)}
+        self._date_index = {d: i for i, d in enumerate(self.dates)}
+
+    @classmethod
+    def from_grid(cls, sheet_name: str, grid: list, date_columns: List[Tuple[date, int]],
+                  classify, revision: Optional[int] = None) -> 'MonthRoster':
+        """Build a roster from grid rows of ``(value, color)`` cells.
+
+        ``date_columns`` are ``(date, column)`` pairs from the header index and
+        ``classify(color, value)`` maps a cell to a role.
+        """
+        names = []
+        roles = array('B')
+
+        # Employee column is first (index 0), first row is headers
+        for row in grid[1:]:
+            name = str(row[0][0]).strip() if row else ""
+            if not name:
+                continue
+
+            names.append(name)
+            for _, col in date_columns:
+                if col < len(row):
+                    value, color = row[col]
+                    roles.append(classify(color, str(value)))
+                else:
+                    roles.append(ROLE_NONE)
+
+        return cls(sheet_name, names, [d for d, _ in date_columns], roles, revision)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was last known to match the spreadsheet."""
+        return time_module.time() - self.validated_at
+
+    def mark_validated(self, at: Optional[float] = None):
+        """Record that the spreadsheet revision was confirmed unchanged."""
+        self.validated_at = max(self.validated_at, at or time_module.time())
+
+    def __contains__(self, day: date) -> bool:
+        return day in self._date_index
+
+    def day(self, day: date) -> List[Tuple[str, int]]:
+        """(name, role) pairs of employees with a role on the given day, in sheet order."""
+        d = self._date_index.get(day)
+        if d is None:
+            return []
+
+        roles = self._roles[d::len(self.dates)]
+        return [(self.names[e], role) for e, role in enumerate(roles) if role != ROLE_NONE]
+
+    def employee(self, name: str) -> List[Tuple[date, int]]:
+        """(date, role) pairs of the days the employee has a role on."""
+        e = self._name_index.get(name)
+        if e is None:
+            return []
+
+        width = len(self.dates)
+        roles = self._roles[e * width:(e + 1) * width]
+        return [(self.dates[d], role) for d, role in enumerate(roles) if role != ROLE_NONE]
+
+    def role(self, name: str, day: date) -> int:
+        e = self._name_index.get(name)
+        d = self._date_index.get(day)
+        if e is None or d is None:
+            return ROLE_NONE
+        return self._roles[e * len(self.dates) + d]
+
+    def cells(self) -> Iterator[Tuple[str, date, int]]:
+        """Iterate over all (name, date, role) assignments in one pass."""
+        width = len(self.dates)
+        for i, role in enumerate(self._roles):
+            if role != ROLE_NONE:
+                e, d = divmod(i, width)
+                yield self.names[e], self.dates[d], role
+
+    def nbytes(self) -> int:
+        """Approximate size of the role matrix in bytes."""
+        return self._roles.itemsize * len(self._roles)
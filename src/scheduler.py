@@ -0,0 +1,86 @@
+"""
+Notification schedule built from the production calendar.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from holiday_api import ProductionCalendarAPI
+
+logger = logging.getLogger(__name__)
+
+# Типы дней производственного календаря, в которые отправляется уведомление
+DAY_WORKING = 1
+DAY_SHORTENED = 5
+WORKING_DAY_TYPES = (DAY_WORKING, DAY_SHORTENED)
+
+# Сколько календарных дней просматривать в поисках рабочих (с запасом на каникулы)
+MAX_SCAN_DAYS = 62
+
+
+class WorkdayTrigger:
+    """One planned notification: the working day and the moment to send it."""
+
+    __slots__ = ("day", "at", "shortened", "day_type")
+
+    def __init__(self, day: date, at: datetime, shortened: bool, day_type: str):
+        self.day = day
+        self.at = at
+        self.shortened = shortened
+        self.day_type = day_type
+
+    def __repr__(self):
+        return f"WorkdayTrigger({self.at.isoformat()}, shortened={self.shortened})"
+
+
+class WorkdayPlanner:
+    """Precompute notification trigger times for the next working days."""
+
+    def __init__(self, calendar_api: ProductionCalendarAPI, timezone, notify_time: time,
+                 short_day_time: Optional[time] = None, days_ahead: int = 10):
+        self.calendar_api = calendar_api
+        self.timezone = timezone
+        self.notify_time = notify_time
+        self.short_day_time = short_day_time or notify_time
+        self.days_ahead = days_ahead
+
+    def trigger_time(self, shortened: bool) -> time:
+        return self.short_day_time if shortened else self.notify_time
+
+    async def plan(self, now: datetime) -> List[WorkdayTrigger]:
+        """Next ``days_ahead`` working days (today included if its time has not passed)."""
+        triggers = []
+        prefetched = set()
+        day = now.date()
+
+        for _ in range(MAX_SCAN_DAYS):
+            if len(triggers) >= self.days_ahead:
+                break
+
+            # Один запрос на месяц, дальше дни берутся из кэша клиента
+            month = (day.year, day.month)
+            if month not in prefetched:
+                prefetched.add(month)
+                await self.calendar_api.prefetch_month(*month)
+
+            moment = self.timezone.localize(datetime.combine(day, time()))
+            day_info = await self.calendar_api.get_day_info(moment)
+            if day_info and isinstance(day_info, dict):
+                type_id = day_info.get("type_id")
+                day_type = day_info.get("type_text", "")
+            else:
+                # Календарь недоступен - считаем рабочими будни, день перепроверится при отправке
+                type_id = DAY_WORKING if day.weekday() < 5 else None
+                day_type = "Рабочий день (по дню недели)"
+
+            if type_id in WORKING_DAY_TYPES:
+                shortened = type_id == DAY_SHORTENED
+                at = self.timezone.localize(datetime.combine(day, self.trigger_time(shortened)))
+                if at > now:
+                    triggers.append(WorkdayTrigger(day, at, shortened, day_type))
+
+            day += timedelta(days=1)
+
+        logger.info(f"📆 Planned {len(triggers)} notifications"
+                    + (f", next at {triggers[0].at.strftime('%d.%m.%Y %H:%M')}" if triggers else ""))
+        return triggers
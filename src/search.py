@@ -0,0 +1,155 @@
+"""
+Fuzzy employee search over roster snapshots.
+
+Names are normalized to a Latin phonetic form (Cyrillic is transliterated,
+common spelling variants are folded), split into words and indexed by
+trigrams, so "Ivanov", "Иванов" and "Ивонов" all find the same person.
+"""
+import bisect
+import logging
+import re
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from roster import MonthRoster, ROLE_LEADER, ROLE_FOLLOWER
+
+logger = logging.getLogger(__name__)
+
+# Minimal similarity of a query word and a name word to count as a match
+MIN_SCORE = 0.45
+# A result this far ahead of the next one is taken as the single answer
+CLEAR_MARGIN = 0.15
+
+# Postings pack (name id, word position) into one int; words past the limit are not indexed
+_POSITION_BITS = 4
+_MAX_WORDS = 1 << _POSITION_BITS
+
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "",
+    "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+
+# Варианты латинского написания, сводимые к одному
+_FOLDS = (("kh", "h"), ("shch", "sch"), ("x", "ks"), ("w", "v"), ("ph", "f"),
+          ("ck", "k"), ("q", "k"), ("j", "y"), ("iy", "y"), ("yi", "y"), ("ii", "i"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> List[str]:
+    """Words of a name in the folded Latin form used by the index."""
+    text = text.casefold().translate(_TRANSLIT)
+    for variant, canonical in _FOLDS:
+        text = text.replace(variant, canonical)
+    return _WORD_RE.findall(text)
+
+
+def trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EmployeeIndex:
+    """Trigram index of employee names with their duty dates.
+
+    Rebuilt only when the set of snapshots (sheet, revision, fetch time)
+    changes; lookups never touch the snapshots themselves.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._words: List[List[Tuple[str, int]]] = []  # name id -> [(word, trigram count)]
+        self._postings: Dict[str, List[int]] = {}  # trigram -> [name id << bits | word position]
+        self._duties: Dict[str, Tuple[List[date], List[int]]] = {}
+        self._key: Optional[tuple] = None
+
+    def update(self, rosters: Iterable[MonthRoster]) -> bool:
+        rosters = list(rosters)
+        key = tuple(sorted((r.sheet_name, r.revision, r.fetched_at) for r in rosters))
+        if key == self._key:
+            return False
+
+        duties: Dict[str, Dict[date, int]] = {}
+        for roster in rosters:
+            for name in roster.names:
+                duties.setdefault(name, {})
+            for name, day, role in roster.cells():
+                if role in (ROLE_LEADER, ROLE_FOLLOWER):
+                    duties[name][day] = role
+
+        names = sorted(duties)
+        words: List[List[Tuple[str, int]]] = []
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for name_id, name in enumerate(names):
+            name_words = []
+            for position, word in enumerate(normalize(name)[:_MAX_WORDS]):
+                grams = trigrams(word)
+                name_words.append((word, len(grams)))
+                for gram in grams:
+                    postings[gram].append(name_id << _POSITION_BITS | position)
+            words.append(name_words)
+
+        self.names = names
+        self._words = words
+        self._postings = dict(postings)
+        self._duties = {
+            name: ([d for d, _ in items], [role for _, role in items])
+            for name, items in ((name, sorted(days.items())) for name, days in duties.items())
+        }
+        self._key = key
+        logger.debug("Employee index rebuilt: %d names, %d trigrams", len(names), len(postings))
+        return True
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Best matching names with scores in 0..1, best first."""
+        query_words = normalize(query)
+        if not query_words:
+            return []
+
+        # name id -> лучшая похожесть для каждого слова запроса
+        best: Dict[int, List[float]] = {}
+        for q, query_word in enumerate(query_words):
+            grams = trigrams(query_word)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+
+            # Слова с меньшим числом общих триграмм не наберут MIN_SCORE
+            min_shared = MIN_SCORE * len(grams) / 2
+            for posting, count in shared.items():
+                if count < min_shared:
+                    continue
+                name_id = posting >> _POSITION_BITS
+                word, word_grams = self._words[name_id][posting & (_MAX_WORDS - 1)]
+                score = 2 * count / (len(grams) + word_grams)
+                if len(query_word) >= 3 and word.startswith(query_word):
+                    # Начало слова ("иван" -> "Иванов") считается почти точным совпадением
+                    score = max(score, 0.9)
+                if word == query_word:
+                    score = 1.0
+                scores = best.setdefault(name_id, [0.0] * len(query_words))
+                scores[q] = max(scores[q], score)
+
+        results = [(self.names[name_id], sum(scores) / len(scores)) for name_id, scores in best.items()]
+        results = [item for item in results if item[1] >= MIN_SCORE]
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+    def resolve(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """The single clear match, or the close candidates."""
+        results = self.search(query, limit)
+        # Равные оценки (однофамильцы) не схлопываются: выбор между ними был бы произвольным
+        if len(results) > 1 and (results[0][1] - results[1][1] >= CLEAR_MARGIN
+                                 or results[0][1] >= 1.0 > results[1][1]):
+            return results[:1]
+        return results
+
+    def upcoming(self, name: str, since: date, limit: int = 5) -> List[Tuple[date, int]]:
+        """Next leader/follower duties of an employee starting from a day."""
+        days, roles = self._duties.get(name, ([], []))
+        start = bisect.bisect_left(days, since)
+        return list(zip(days[start:start + limit], roles[start:start + limit]))
@@ -0,0 +1,90 @@
+"""
+Stale-while-revalidate serving of duty data from roster snapshots.
+"""
+import asyncio
+import logging
+import time as time_module
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from google_sheets import DutyResult, GoogleSheetsClient
+
+logger = logging.getLogger(__name__)
+
+
+class DutySnapshotService:
+    """Answer duty queries from the latest snapshot, refreshing it in the background.
+
+    * younger than ``soft_ttl`` - served as is;
+    * older than ``soft_ttl`` - served immediately, a background refresh starts;
+    * older than ``hard_ttl`` - the refresh is awaited, the stale snapshot is
+      served only if the refresh fails.
+    """
+
+    def __init__(self, google_client: GoogleSheetsClient, soft_ttl: float, hard_ttl: float):
+        self.google_client = google_client
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.last_refresh_at: Optional[float] = None
+        self.last_refresh_error: Optional[str] = None
+        self._refreshes: Dict[str, asyncio.Task] = {}
+
+    def snapshot_age(self, day: datetime) -> Optional[float]:
+        roster = self.google_client.get_roster(self.google_client.get_sheet_name_for_date(day))
+        return roster.age if roster else None
+
+    def refreshing(self) -> bool:
+        return any(not task.done() for task in self._refreshes.values())
+
+    def refresh(self, day: datetime) -> asyncio.Task:
+        """Start (or join) a background refresh of the month containing the day."""
+        sheet_name = self.google_client.get_sheet_name_for_date(day)
+        task = self._refreshes.get(sheet_name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh(day), name=f"refresh-{sheet_name}")
+            self._refreshes[sheet_name] = task
+        return task
+
+    async def _refresh(self, day: datetime) -> bool:
+        started = time_module.monotonic()
+        try:
+            roster = await asyncio.to_thread(self.google_client.refresh_month, day)
+        except Exception as e:
+            roster = None
+            self.last_refresh_error = str(e)
+
+        if roster is None:
+            self.last_refresh_error = self.last_refresh_error or "snapshot was not updated"
+            logger.warning(f"Snapshot refresh failed: {self.last_refresh_error}")
+            return False
+
+        self.last_refresh_at = time_module.time()
+        self.last_refresh_error = None
+        logger.info("Snapshot '%s' refreshed in %.0f ms", roster.sheet_name,
+                    (time_module.monotonic() - started) * 1000, extra={'sample': True})
+        return True
+
+    async def get_duty(self, day: datetime) -> Tuple[DutyResult, Optional[float]]:
+        """Duty for a day and the age of the snapshot it came from (None if read directly)."""
+        age = self.snapshot_age(day)
+
+        if age is None or age > self.hard_ttl:
+            await self.refresh(day)
+        elif age > self.soft_ttl:
+            self.refresh(day)
+
+        duty = self.google_client.get_cached_duty(day)
+        if duty is None:
+            # Снимка нет (лист или столбец не найден) - читаем напрямую ради текста ошибки
+            return await asyncio.to_thread(self.google_client.get_duty, day), None
+        return duty, self.snapshot_age(day)
+
+    def state(self, day: datetime) -> Dict[str, Any]:
+        return {
+            "age": self.snapshot_age(day),
+            "soft_ttl": self.soft_ttl,
+            "hard_ttl": self.hard_ttl,
+            "refreshing": self.refreshing(),
+            "last_refresh_at": self.last_refresh_at,
+            "last_refresh_error": self.last_refresh_error,
+        }
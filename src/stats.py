@@ -0,0 +1,119 @@
+"""
+Duty statistics from per-month aggregates of roster snapshots.
+"""
+import logging
+import re
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from roster import MonthRoster, ROLE_LEADER, ROLE_FOLLOWER, ROLE_VACATION
+
+logger = logging.getLogger(__name__)
+
+# Positions of role counters in an aggregate row
+COUNTED_ROLES = (ROLE_LEADER, ROLE_FOLLOWER, ROLE_VACATION)
+_ROLE_SLOT = {role: i for i, role in enumerate(COUNTED_ROLES)}
+
+_MONTH_RE = re.compile(r'^(\d{1,2})[./](\d{4})$')
+_YEAR_RE = re.compile(r'^(\d{4})$')
+# Quarter needs its marker on either side: "Q2", "2q", "кв2", "2кв", optionally with a year
+_QUARTER_RE = re.compile(r'^(?:(?:q|кв)([1-4])|([1-4])(?:q|кв))(?:[./ ](\d{4}))?$', re.IGNORECASE)
+
+
+class MonthStats:
+    """Per-employee role counts of one month snapshot."""
+
+    __slots__ = ('sheet_name', 'revision', 'fetched_at', 'counts')
+
+    def __init__(self, sheet_name: str, revision: Optional[int], fetched_at: float,
+                 counts: Dict[str, List[int]]):
+        self.sheet_name = sheet_name
+        self.revision = revision
+        self.fetched_at = fetched_at
+        self.counts = counts
+
+    @classmethod
+    def from_roster(cls, roster: MonthRoster) -> 'MonthStats':
+        counts: Dict[str, List[int]] = {}
+        for name, _, role in roster.cells():
+            slot = _ROLE_SLOT.get(role)
+            if slot is not None:
+                counts.setdefault(name, [0] * len(COUNTED_ROLES))[slot] += 1
+        return cls(roster.sheet_name, roster.revision, roster.fetched_at, counts)
+
+    def is_current_for(self, roster: MonthRoster) -> bool:
+        return self.revision == roster.revision and self.fetched_at == roster.fetched_at
+
+
+class StatsIndex:
+    """Month aggregates keyed by sheet name, recomputed only for changed snapshots.
+
+    Aggregates outlive the snapshots they came from, so stats for a long
+    period are a merge of small per-month dicts.
+    """
+
+    def __init__(self):
+        self.months: Dict[str, MonthStats] = {}
+
+    def update(self, rosters: Iterable[MonthRoster]) -> int:
+        """Refresh aggregates of new or changed snapshots; returns how many were recomputed."""
+        updated = 0
+        for roster in rosters:
+            stats = self.months.get(roster.sheet_name)
+            if stats is None or not stats.is_current_for(roster):
+                self.months[roster.sheet_name] = MonthStats.from_roster(roster)
+                updated += 1
+        if updated:
+            logger.debug("Stats updated for %d months", updated)
+        return updated
+
+    def totals(self, sheet_names: Iterable[str]) -> Dict[str, List[int]]:
+        """Merged role counts per employee over the given months."""
+        totals: Dict[str, List[int]] = {}
+        for sheet_name in sheet_names:
+            stats = self.months.get(sheet_name)
+            if stats is None:
+                continue
+            for name, counts in stats.counts.items():
+                row = totals.setdefault(name, [0] * len(COUNTED_ROLES))
+                for i, count in enumerate(counts):
+                    row[i] += count
+        return totals
+
+
+def parse_period(text: str, today: date) -> Optional[Tuple[str, List[date]]]:
+    """Parse a /stats period into a title and the first days of its months.
+
+    Accepts nothing / "месяц", "квартал", "год", "MM.YYYY", "YYYY" and
+    quarters like "Q2", "2кв 2026". Returns None for an unknown period.
+    """
+    text = text.strip().lower()
+
+    if text in ("", "месяц", "month"):
+        return f"{today.month:02d}.{today.year}", [today.replace(day=1)]
+
+    if text in ("год", "year"):
+        return f"{today.year} год", [date(today.year, m, 1) for m in range(1, 13)]
+
+    if text in ("квартал", "quarter"):
+        quarter, year = (today.month - 1) // 3 + 1, today.year
+    else:
+        match = _MONTH_RE.match(text)
+        if match:
+            month, year = int(match.group(1)), int(match.group(2))
+            if not 1 <= month <= 12:
+                return None
+            return f"{month:02d}.{year}", [date(year, month, 1)]
+
+        match = _YEAR_RE.match(text)
+        if match:
+            year = int(match.group(1))
+            return f"{year} год", [date(year, m, 1) for m in range(1, 13)]
+
+        match = _QUARTER_RE.match(text)
+        if not match:
+            return None
+        quarter, year = int(match.group(1) or match.group(2)), int(match.group(3) or today.year)
+
+    first_month = (quarter - 1) * 3 + 1
+    return f"{quarter} квартал {year}", [date(year, first_month + i, 1) for i in range(3)]
@@ -0,0 +1,112 @@
+"""
+Personal duty subscriptions: Telegram user -> roster name.
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from roster import MonthRoster
+
+logger = logging.getLogger(__name__)
+
+MODE_EVENING = "evening"
+MODE_MORNING = "morning"
+
+MODE_ALIASES = {
+    "evening": MODE_EVENING, "вечер": MODE_EVENING, "вечером": MODE_EVENING,
+    "morning": MODE_MORNING, "утро": MODE_MORNING, "утром": MODE_MORNING,
+}
+
+
+class SubscriptionStore:
+    """Subscriptions persisted as a small JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscriptions: Dict[int, Dict[str, str]] = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.subscriptions = {int(user_id): sub for user_id, sub in data.items()}
+            logger.info(f"Loaded {len(self.subscriptions)} subscriptions")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load subscriptions from {self.path}: {e}")
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и атомарно подменяем
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding='utf-8') as f:
+            json.dump({str(k): v for k, v in self.subscriptions.items()}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get(self, user_id: int) -> Optional[Dict[str, str]]:
+        return self.subscriptions.get(user_id)
+
+    def subscribe(self, user_id: int, name: str, mode: str):
+        self.subscriptions[user_id] = {"name": name, "mode": mode}
+        self.save()
+
+    def unsubscribe(self, user_id: int) -> bool:
+        if self.subscriptions.pop(user_id, None) is None:
+            return False
+        self.save()
+        return True
+
+    def by_mode(self, mode: str) -> List[Tuple[int, str]]:
+        return [(user_id, sub["name"]) for user_id, sub in self.subscriptions.items() if sub["mode"] == mode]
+
+
+class DutyIndex:
+    """name -> {date: role} index built in one pass over roster snapshots.
+
+    Rebuilt only when the set of snapshots (sheet, revision, fetch time) changes.
+    """
+
+    def __init__(self):
+        self.by_name: Dict[str, Dict[date, int]] = {}
+        self._key: Optional[tuple] = None
+
+    def update(self, rosters: Iterable[MonthRoster]) -> bool:
+        rosters = list(rosters)
+        key = tuple(sorted((r.sheet_name, r.revision, r.fetched_at) for r in rosters))
+        if key == self._key:
+            return False
+
+        by_name: Dict[str, Dict[date, int]] = {}
+        for roster in rosters:
+            for name, day, role in roster.cells():
+                by_name.setdefault(name, {})[day] = role
+
+        self.by_name = by_name
+        self._key = key
+        return True
+
+    def role(self, name: str, day: date) -> int:
+        return self.by_name.get(name, {}).get(day, 0)
+
+
+def resolve_name(query: str, names: Iterable[str]) -> Tuple[Optional[str], List[str]]:
+    """Match a user-provided name against roster names.
+
+    Returns the matched name, or None and the list of candidates.
+    """
+    needle = query.casefold().strip()
+    names = sorted(set(names))
+
+    for name in names:
+        if name.casefold() == needle:
+            return name, [name]
+
+    candidates = [name for name in names if needle in name.casefold()]
+    if len(candidates) == 1:
+        return candidates[0], candidates
+    return None, candidates
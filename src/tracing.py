@@ -0,0 +1,282 @@
+"""
+Lightweight tracing: a trace per update or job, child spans per stage and
+external call, exported off the event loop to a rotating JSONL file and,
+optionally, to an OTLP/HTTP collector.
+
+The current span lives in a context variable, so spans opened in
+``asyncio.to_thread`` workers and in awaited coroutines become children
+of the span that was active when they were started.
+"""
+import atexit
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time as time_module
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 100
+
+
+class Span:
+    """One timed operation of a trace."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns',
+                 'attributes', 'error')
+
+    def __init__(self, name: str, parent: Optional['Span'], attributes: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time_module.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> 'Span':
+        self.attributes[key] = value
+        return self
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time_module.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is off so call sites never branch."""
+
+    trace_id = span_id = None
+
+    def set(self, key: str, value: Any) -> '_NoopSpan':
+        return self
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class JsonlExporter:
+    """Finished spans as JSON lines in a size-rotated file."""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # RotatingFileHandler даёт ротацию; пишем через него готовые строки
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+            self._handler.handle(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+
+    def shutdown(self):
+        self._handler.close()
+
+
+class OtlpHttpExporter:
+    """Spans in OTLP/HTTP JSON format posted to a collector (e.g. http://collector:4318/v1/traces)."""
+
+    def __init__(self, endpoint: str, service_name: str = "duty-bot", timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._failing = False
+
+    @staticmethod
+    def _value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, span: Span) -> Dict[str, Any]:
+        data = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            data["parentSpanId"] = span.parent_id
+        return data
+
+    def export(self, spans: List[Span]):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "duty-bot"}, "spans": [self._span(s) for s in spans]}],
+        }]}
+        try:
+            response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            self._failing = False
+        except Exception as e:
+            # Коллектор недоступен - предупреждаем один раз, спаны в JSONL не теряются
+            if not self._failing:
+                logger.warning(f"OTLP export to {self.endpoint} failed: {e}")
+            self._failing = True
+
+    def shutdown(self):
+        self.session.close()
+
+
+class TraceContextFilter(logging.Filter):
+    """Add the current trace id to log records (exported by the JSON log format)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+        return True
+
+
+class Tracer:
+    """Creates spans and hands finished ones to exporters on a background thread."""
+
+    def __init__(self):
+        self.enabled = False
+        self.exporters = []
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, exporters: list):
+        """Enable tracing with the given exporters."""
+        self.exporters = exporters
+        self.enabled = bool(exporters)
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+            for handler in logging.getLogger().handlers:
+                handler.addFilter(TraceContextFilter())
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Any]:
+        """Child of the current span, or the root of a new trace if there is none."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time_module.time_ns()
+            self._queue.put(span)
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Any]:
+        """Root span of a new trace, regardless of the current one."""
+        token = _current_span.set(None)
+        try:
+            with self.span(name, **attributes) as span:
+                yield span
+        finally:
+            _current_span.reset(token)
+
+    def _export_loop(self):
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    span = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if span is None:
+                    self._export(batch)
+                    return
+                batch.append(span)
+            self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.error(f"Trace export failed: {e}")
+
+    def shutdown(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+TRACER = Tracer()
+
+
+def traced(name: Optional[str] = None, root: bool = False):
+    """Run the decorated function (sync or async) inside a span.
+
+    ``root=True`` always starts a new trace (jobs: the scheduler's context may
+    carry the span of the update that scheduled them).
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        def scope():
+            return TRACER.trace(span_name) if root else TRACER.span(span_name)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with scope():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with scope():
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
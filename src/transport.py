@@ -0,0 +1,131 @@
+"""
+Telegram HTTP transports: a long-poll one for getUpdates and a pooled one
+for everything the bot sends, with connection pool metrics.
+"""
+import importlib.util
+import logging
+import time as time_module
+from typing import Dict, List
+
+import httpx
+from telegram.request import HTTPXRequest
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+_TRANSPORTS: List['InstrumentedRequest'] = []
+
+
+def _register_metrics():
+    METRICS.register_callback(
+        "telegram_http_pool_connections",
+        lambda: [({"transport": t.name, "state": state}, t.pool_state()[state])
+                 for t in _TRANSPORTS for state in ("active", "idle")],
+        help="Open connections in the Telegram HTTP pool by state"
+    )
+    METRICS.register_callback(
+        "telegram_http_pool_limit",
+        lambda: [({"transport": t.name}, t.pool_size) for t in _TRANSPORTS],
+        help="Maximum connections of the Telegram HTTP pool"
+    )
+    METRICS.register_callback(
+        "telegram_http_in_flight",
+        lambda: [({"transport": t.name}, t.in_flight) for t in _TRANSPORTS],
+        help="Telegram HTTP requests in progress"
+    )
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that counts requests, errors and in-flight calls per transport."""
+
+    def __init__(self, name: str, connection_pool_size: int, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self.name = name
+        self.pool_size = connection_pool_size
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        if not _TRANSPORTS:
+            _register_metrics()
+        _TRANSPORTS.append(self)
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        labels = {"transport": self.name}
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time_module.monotonic()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            METRICS.inc("telegram_http_errors_total", labels=labels,
+                        help="Failed Telegram HTTP requests")
+            raise
+        finally:
+            self.in_flight -= 1
+            METRICS.inc("telegram_http_requests_total", labels=labels,
+                        help="Telegram HTTP requests")
+            METRICS.inc("telegram_http_request_seconds_total", time_module.monotonic() - started,
+                        labels=labels, help="Time spent in Telegram HTTP requests")
+
+    def pool_state(self) -> Dict[str, int]:
+        """Connections of the underlying httpcore pool (best effort, read without locking)."""
+        transport = getattr(self._client, "_transport", None)
+        connections = list(getattr(getattr(transport, "_pool", None), "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "active": len(connections) - idle,
+            "idle": idle,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "limit": self.pool_size,
+        }
+
+
+def transports_state() -> Dict[str, Dict[str, int]]:
+    return {t.name: t.pool_state() for t in _TRANSPORTS}
+
+
+def _http_version(http2: bool) -> str:
+    if not http2:
+        return "1.1"
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed "
+                       "(pip install \"python-telegram-bot[http2]\"), using HTTP/1.1")
+        return "1.1"
+    return "2"
+
+
+def build_send_request(config) -> InstrumentedRequest:
+    """Transport for outgoing calls: a larger keep-alive pool and tight timeouts."""
+    pool_size = config.TELEGRAM_POOL_SIZE
+    return InstrumentedRequest(
+        "send",
+        connection_pool_size=pool_size,
+        connect_timeout=config.TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=config.TELEGRAM_READ_TIMEOUT,
+        write_timeout=config.TELEGRAM_WRITE_TIMEOUT,
+        pool_timeout=config.TELEGRAM_POOL_TIMEOUT,
+        http_version=_http_version(config.TELEGRAM_HTTP2),
+        httpx_kwargs={"limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=config.TELEGRAM_KEEPALIVE_EXPIRY,
+        )},
+    )
+
+
+def build_get_updates_request(config) -> InstrumentedRequest:
+    """Transport for getUpdates: one long-poll connection.
+
+    The poll timeout is added to the read timeout by the library, so the
+    read timeout here only covers the network margin.
+    """
+    return InstrumentedRequest(
+        "get_updates",
+        connection_pool_size=1,
+        connect_timeout=config.TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=config.TELEGRAM_READ_TIMEOUT,
+        write_timeout=config.TELEGRAM_WRITE_TIMEOUT,
+        pool_timeout=config.TELEGRAM_POOL_TIMEOUT,
+    )
@@ -0,0 +1,88 @@
+"""
+Concurrent update processing that keeps updates of one chat in order.
+"""
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process up to ``max_concurrent_updates`` updates at once, one at a time per chat.
+
+    An update for a chat that is already busy is queued behind it and the
+    concurrency slot is released right away, so a flooding chat holds at
+    most one slot and never delays other chats.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._pending: Dict[int, Deque[Tuple[object, Awaitable[Any]]]] = {}
+
+    @staticmethod
+    def chat_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        # Inline-запросы и прочие обновления без чата порядка не требуют
+        return None
+
+    @property
+    def busy_chats(self) -> int:
+        return len(self._pending)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Чат занят - обработает тот, кто уже выполняется
+            pending.append((update, coroutine))
+            return
+
+        pending = self._pending[key] = deque()
+        try:
+            await self._run(update, coroutine)
+            while pending:
+                await self._run(*pending.popleft())
+        finally:
+            del self._pending[key]
+            for _, leftover in pending:
+                leftover.close()
+
+    @staticmethod
+    def _trace_attributes(update: object) -> dict:
+        if not isinstance(update, Update):
+            return {}
+        attributes = {"update_id": update.update_id}
+        if update.effective_chat:
+            attributes["chat_id"] = update.effective_chat.id
+        message = update.effective_message
+        if message and message.text and message.text.startswith("/"):
+            attributes["command"] = message.text.split()[0]
+        elif update.inline_query:
+            attributes["command"] = "inline"
+        return attributes
+
+    async def _run(self, update: object, coroutine: Awaitable[Any]):
+        attributes = self._trace_attributes(update) if TRACER.enabled else {}
+        with TRACER.trace("update", **attributes):
+            try:
+                await coroutine
+            except Exception as e:
+                # Application сам обрабатывает ошибки хендлеров; сюда попадает только непредвиденное
+                logger.error(f"Update processing failed: {e}", exc_info=True)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,67 @@
+"""
+Employee name resolution shared by /who and the per-employee duty feeds.
+"""
+import asyncio
+import sys
+import types
+from array import array
+from datetime import date
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from health import HealthServer  # noqa: E402
+from roster import MonthRoster, ROLE_FOLLOWER, ROLE_LEADER, ROLE_NONE  # noqa: E402
+from search import EmployeeIndex  # noqa: E402
+
+NAMES = ["Иванов Иван", "Иванов Пётр", "Петров Сергей"]
+
+
+def make_roster() -> MonthRoster:
+    dates = [date(2026, 10, day) for day in range(1, 4)]
+    roles = array("B", [
+        ROLE_LEADER, ROLE_NONE, ROLE_NONE,
+        ROLE_NONE, ROLE_LEADER, ROLE_NONE,
+        ROLE_FOLLOWER, ROLE_FOLLOWER, ROLE_LEADER,
+    ])
+    return MonthRoster("Октябрь", NAMES, dates, roles, revision=1)
+
+
+def make_index() -> EmployeeIndex:
+    index = EmployeeIndex()
+    index.update([make_roster()])
+    return index
+
+
+def test_shared_surname_is_ambiguous():
+    index = make_index()
+    for query in ("Иванов", "ivanov"):
+        assert sorted(name for name, _ in index.resolve(query)) == ["Иванов Иван", "Иванов Пётр"]
+
+
+def test_full_name_resolves_to_one_employee():
+    index = make_index()
+    assert [name for name, _ in index.resolve("Иванов Пётр")] == ["Иванов Пётр"]
+    assert [name for name, _ in index.resolve("Petrov")] == ["Петров Сергей"]
+
+
+def test_feed_for_shared_surname_is_not_served():
+    roster = make_roster()
+    server = object.__new__(HealthServer)
+    server.handlers = types.SimpleNamespace(
+        config=types.SimpleNamespace(FEED_TOKEN="secret"),
+        google_client=types.SimpleNamespace(rosters={roster.sheet_name: roster}, metadata=None),
+        employees=EmployeeIndex(),
+    )
+    request = make_mocked_request("GET", "/feeds/employee/Иванов.ics?token=secret",
+                                  match_info={"name": "Иванов", "fmt": "ics"})
+
+    try:
+        asyncio.run(server.handle_feed(request))
+    except web.HTTPNotFound as error:
+        assert error.text == "Ambiguous employee name"
+    else:
+        raise AssertionError("Feed served for an ambiguous name")